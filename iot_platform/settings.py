@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 
@@ -44,11 +45,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "iotcore.metrics.MetricsMiddleware",     # 放最前：统计完整请求耗时
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "iotcore.profiling.ProfilingMiddleware",
+    "iotcore.db_router.ReplicaPinMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -87,8 +91,34 @@ DATABASES = {
     "PORT": "13306",
     "OPTIONS": {"charset": "utf8mb4",
                 "init_command": "SET sql_mode='STRICT_TRANS_TABLES'"},
+    # 持久连接：每个 worker 复用连接，取用前做健康检查（断线自动重连）
+    "CONN_MAX_AGE": 300,
+    "CONN_HEALTH_CHECKS": True,
   }
 }
+# manage.py backfill --method load-data 需要客户端允许 LOAD DATA LOCAL INFILE（服务端亦需 local_infile=ON）
+if os.environ.get("IOT_DB_LOCAL_INFILE") == "1":
+    DATABASES["default"]["OPTIONS"]["local_infile"] = 1
+
+# 只读副本：IOT_DB_REPLICAS="host1:port1,host2:port2"，账号/库名与主库一致
+# 未配置时所有读写都走 default
+DB_REPLICAS = []
+for _i, _addr in enumerate(filter(None, os.environ.get("IOT_DB_REPLICAS", "").split(","))):
+    _host, _, _port = _addr.strip().partition(":")
+    _alias = f"replica{_i + 1}"
+    DATABASES[_alias] = {**DATABASES["default"], "HOST": _host, "PORT": _port or "3306",
+                         "TEST": {"MIRROR": "default"}}
+    DB_REPLICAS.append(_alias)
+
+# 本地开发/基准测试：IOT_DB_ENGINE=sqlite 时改用 SQLite（没有 MySQL 触发器/存储过程）
+if os.environ.get("IOT_DB_ENGINE") == "sqlite":
+    DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"}}
+    DB_REPLICAS = []
+
+DATABASE_ROUTERS = ["iotcore.db_router.ReplicaRouter"]
+DB_REPLICA_MAX_LAG = 5            # 秒：副本延迟超过该值时读回主库
+DB_REPLICA_LAG_CHECK_INTERVAL = 2  # 秒：副本延迟探测结果的缓存时间
+DB_REPLICA_PIN_SECONDS = 10       # 秒：写入后该客户端读主库的时长（read-your-writes）
 TIME_ZONE = 'Asia/Shanghai'       # 建议存UTC
 USE_TZ = True
 
@@ -138,6 +168,46 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
+# 后台任务（iotcore/jobs.py）与内置调度（manage.py run_scheduler，取代 ev_sync_to_cloud / ev_daily_report）
+IOT_JOB_WORKERS = 2               # 每个进程的任务线程数
+IOT_JOB_HEARTBEAT = 30            # 秒：运行中任务刷新 heartbeat_at 的间隔
+IOT_JOB_STALE_AFTER = 600         # 秒：心跳（或排队）超过该时长的 sync/日报任务视为 worker 已退出，标记为 failed
+IOT_SYNC_BATCH = 500              # 每次 CALL PROC_sync_to_cloud 的批大小
+IOT_SYNC_MAX_BATCHES = 1000       # 单个同步任务最多执行的批次
+IOT_SYNC_INTERVALS = [            # (sync_queue 最小深度, 同步间隔秒)：积压越多同步越频繁
+    (0, 300),
+    (1_000, 60),
+    (10_000, 15),
+    (100_000, 5),
+]
+IOT_DAILY_REPORT_AT = "00:05"     # 每日生成前一天日报的本地时刻
+
+# 告警合并与回差（iotcore/alerting.py），Device.alert_hysteresis / alert_min_duration 可按设备覆盖
+ALERT_HYSTERESIS = 0.5            # 回差（与数值同单位）
+ALERT_MIN_DURATION = 0            # 秒：持续越限多久才开告警
+ALERT_DEBOUNCE_SAMPLES = 1        # 连续越限多少个样本才开告警
+
+# Prometheus 指标（/metrics）：多进程部署时设置 IOT_METRICS_DIR 为各 worker 共享的目录
+METRICS_DIR = os.environ.get("IOT_METRICS_DIR")
+METRICS_FLUSH_INTERVAL = 5        # 秒：worker 快照写盘间隔
+
+# 按需请求剖析（iotcore/profiling.py）：关闭时中间件不加载
+PROFILING_ENABLED = os.environ.get("IOT_PROFILING") == "1"
+PROFILING_SAMPLE_RATE = 0.0       # 抽样比例（0 = 只剖析带签名头的请求）
+PROFILING_KEEP = 200              # request_profiles 环形保留条数
+PROFILING_TOP_FUNCTIONS = 60      # 保存的 cProfile 函数条数
+PROFILING_TOKEN_MAX_AGE = 86400   # 秒：X-Iot-Profile 令牌有效期
+
+# 日报分位数草图（DDSketch）
+SKETCH_RELATIVE_ACCURACY = 0.01   # 分位数相对误差上限
+SKETCH_MAX_BINS = 2048            # 单个草图的最大桶数（超出时合并最靠近 0 的桶）
+SKETCH_FLUSH_INTERVAL = 10        # 秒：上报缓冲合并进 daily_summary 的周期
+
+ADMIN_COUNT_CAP = 10_000          # admin 大表分页：过滤结果最多数到该行数；未过滤且表更大时用表统计估算
+
+CLOUD_EXPORT_MAX_ROWS = 5_000_000   # /api/cloud/export 单次导出上限
+CLOUD_EXPORT_CHUNK_ROWS = 50_000    # 导出分块读取的每块行数（流式输出，内存只与该值有关）
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "IoT Edge-Cloud API",
     "VERSION": "0.1.0",
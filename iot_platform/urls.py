@@ -18,6 +18,7 @@ from django.views.generic import RedirectView
 from django.contrib import admin
 from django.urls import path, include
 from iotcore import views as v
+from iotcore.metrics import metrics_view
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
 urlpatterns = [
@@ -31,6 +32,9 @@ urlpatterns = [
     # 再接入 iotcore 里其他路由/DRF router
     path('', include('iotcore.urls')),
 
+    # 监控
+    path("metrics", metrics_view, name="metrics"),
+
     # 文档
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="docs"),
@@ -1,56 +1,179 @@
+from django.conf import settings
 from django.contrib import admin
-from django.utils.html import format_html
-from .models import Device, EdgeData, Alert, SyncQueue, CloudData, DailySummary, DeviceCredentials
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.html import format_html, format_html_join
+from .models import Device, DeviceChannel, EdgeData, Alert, AlertState, SyncQueue, CloudData, DailySummary, DeviceCredentials, RequestProfile
+import datetime
 import secrets
 
+# =========================
+# 大表支持：估算总数分页 + 走 ts 索引的时间范围过滤
+# =========================
+def _table_row_estimate(model, using):
+    """读表统计信息估算行数（MySQL information_schema / PostgreSQL pg_class），拿不到返回 None。"""
+    conn = connections[using]
+    table = model._meta.db_table
+    if conn.vendor == "mysql":
+        sql = ("SELECT TABLE_ROWS FROM information_schema.TABLES "
+               "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s")
+    elif conn.vendor == "postgresql":
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE relname = %s"
+    else:
+        return None
+    with conn.cursor() as cur:
+        cur.execute(sql, [table])
+        row = cur.fetchone()
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    未加过滤条件时用表统计估算总数，避免对上亿行的表做 COUNT(*)；
+    有过滤条件时最多数到 ADMIN_COUNT_CAP 行（COUNT 子查询带 LIMIT）。
+    """
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not qs.query.where:
+            estimate = _table_row_estimate(qs.model, qs.db)
+            if estimate is not None and estimate >= settings.ADMIN_COUNT_CAP:
+                return estimate
+        return qs[:settings.ADMIN_COUNT_CAP].count()
+
+
+class TsRangeFilter(admin.SimpleListFilter):
+    """按最近时间窗过滤（ts >= now - 窗口），命中 ts 索引；替代 date_hierarchy 的 DISTINCT 日期扫描。"""
+    title = "时间范围"
+    parameter_name = "ts_range"
+    field_name = "ts"
+    RANGES = {"1h": ("最近 1 小时", 1), "24h": ("最近 24 小时", 24),
+              "7d": ("最近 7 天", 24 * 7), "30d": ("最近 30 天", 24 * 30)}
+
+    def lookups(self, request, model_admin):
+        return [(k, label) for k, (label, _) in self.RANGES.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.RANGES:
+            return queryset
+        since = timezone.now() - datetime.timedelta(hours=self.RANGES[self.value()][1])
+        return queryset.filter(**{f"{self.field_name}__gte": since})
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """时序大表的公共配置：估算分页、不做全表 COUNT、时间窗过滤。"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_filter = (TsRangeFilter,)
+
+
+class DeviceChannelInline(admin.TabularInline):
+    model = DeviceChannel
+    extra = 0
+
+
 @admin.register(Device)
 class DeviceAdmin(admin.ModelAdmin):
     list_display = ("id","device_code","device_name","sensor_type","threshold_hi","last_seen","created_at","has_cred")
     search_fields = ("device_code","device_name","location","sensor_type")
     list_filter = ("sensor_type","location","created_at")
     actions = ["generate_credentials"]
+    inlines = [DeviceChannelInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            _has_cred=Exists(DeviceCredentials.objects.filter(device=OuterRef("pk"))))
 
     def has_cred(self, obj):
-        return DeviceCredentials.objects.filter(device=obj).exists()
+        return obj._has_cred
     has_cred.short_description = "Has Credentials"
     has_cred.boolean = True
+    has_cred.admin_order_field = "_has_cred"
 
     def generate_credentials(self, request, queryset):
-        created = 0
-        for dev in queryset:
-            if not DeviceCredentials.objects.filter(device=dev).exists():
-                api_key = secrets.token_hex(16)      # 32位hex
-                secret  = secrets.token_hex(32)      # 64位hex
-                DeviceCredentials.objects.create(device=dev, api_key=api_key, hmac_secret=secret)
-                created += 1
-        self.message_user(request, f"生成凭证成功：{created} 台设备")
+        have = set(DeviceCredentials.objects.filter(device__in=queryset).values_list("device_id", flat=True))
+        creds = [
+            DeviceCredentials(device_id=dev_id,
+                              api_key=secrets.token_hex(16),      # 32位hex
+                              hmac_secret=secrets.token_hex(32))  # 64位hex
+            for dev_id in queryset.values_list("id", flat=True) if dev_id not in have
+        ]
+        DeviceCredentials.objects.bulk_create(creds, batch_size=1000)
+        self.message_user(request, f"生成凭证成功：{len(creds)} 台设备")
     generate_credentials.short_description = "为选中设备生成 API 凭证"
 
 @admin.register(DeviceCredentials)
 class DeviceCredentialsAdmin(admin.ModelAdmin):
     list_display = ("id","device","api_key","hmac_secret","rotated_at")
     search_fields = ("device__device_code","api_key")
+    list_select_related = ("device",)
+    raw_id_fields = ("device",)
 
 @admin.register(Alert)
-class AlertAdmin(admin.ModelAdmin):
-    list_display = ("id","device","level","message","ts")
-    search_fields = ("device__device_code","message")
-    list_filter = ("level",)
+class AlertAdmin(LargeTableAdmin):
+    list_display = ("id","device","level","channel","state","count","last_value","message","ts","cleared_at")
+    search_fields = ("=device__device_code","message")
+    list_filter = (TsRangeFilter,"level","state")
+    list_select_related = ("device",)
+    raw_id_fields = ("device","edge_data")
+
+@admin.register(AlertState)
+class AlertStateAdmin(admin.ModelAdmin):
+    list_display = ("id","device","level","channel","state","since","samples","alert","updated_at")
+    list_filter = ("level","state")
+    list_select_related = ("device","alert")
+    raw_id_fields = ("device","alert")
 
 @admin.register(EdgeData)
-class EdgeDataAdmin(admin.ModelAdmin):
+class EdgeDataAdmin(LargeTableAdmin):
     list_display = ("id","device","sensor_value","ts","source_ts","quality")
-    search_fields = ("device__device_code",)
+    search_fields = ("=device__device_code",)     # 精确匹配，走 device_code 唯一索引
+    list_select_related = ("device",)
+    raw_id_fields = ("device",)
 
 @admin.register(SyncQueue)
 class SyncQueueAdmin(admin.ModelAdmin):
     list_display = ("id","edge_data","enqueued_at")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ("edge_data",)
+    raw_id_fields = ("edge_data",)
 
 @admin.register(CloudData)
-class CloudDataAdmin(admin.ModelAdmin):
+class CloudDataAdmin(LargeTableAdmin):
     list_display = ("id","device_id","sensor_value","ts","synced_at")
 
 @admin.register(DailySummary)
 class DailySummaryAdmin(admin.ModelAdmin):
-    list_display = ("id","day","device_id","count_records","avg_value","max_value","min_value","alert_count","generated_at")
+    list_display = ("id","day","device_id","channel","count_records","avg_value","max_value","min_value","alert_count","generated_at")
     list_filter = ("day",)
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ("id","created_at","method","path","status","duration_ms","sql_count","sql_ms","trigger","user")
+    list_filter = ("trigger","method","status")
+    search_fields = ("path",)
+    fields = ("created_at","method","path","status","trigger","user","duration_ms","sql_count","sql_ms",
+              "profile_text","sql_timeline_table")
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def profile_text(self, obj):
+        return format_html('<pre style="white-space:pre;overflow:auto;max-height:600px">{}</pre>', obj.profile)
+    profile_text.short_description = "cProfile"
+
+    def sql_timeline_table(self, obj):
+        rows = format_html_join(
+            "", "<tr><td>{}</td><td>{}</td><td>{}</td><td><code>{}</code></td></tr>",
+            ((q["start_ms"], q["duration_ms"], q["alias"], q["sql"]) for q in obj.sql_timeline),
+        )
+        return format_html("<table><tr><th>start ms</th><th>ms</th><th>db</th><th>SQL</th></tr>{}</table>", rows)
+    sql_timeline_table.short_description = "SQL timeline"
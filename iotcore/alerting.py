@@ -0,0 +1,131 @@
+# iotcore/alerting.py
+"""
+告警合并 + 回差（取代 MySQL 触发器 trg_edge_alerts 的“每个越限样本一行告警”）：
+- 越限（> threshold_hi / < threshold_lo）后，连续 ALERT_DEBOUNCE_SAMPLES 个样本且持续 min_duration 秒才开一条 OPEN 告警；
+- OPEN 期间的越限样本只累加 count、更新 last_value / last_ts，不再插入新行；
+- 回到 阈值∓回差 之外才 CLEARED；在回差带内维持原状态，避免在阈值附近抖动反复开关；
+- 多通道设备每个通道（DeviceChannel）按各自阈值独立维护状态，状态与告警都带 channel。
+告警写入量因此按“事件数”而不是“样本数”增长。
+"""
+from __future__ import annotations
+
+import datetime
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .channels import unpack_channels
+from .models import Alert, AlertState, Device, DeviceChannel, EdgeData
+
+
+def _config(device: Device, channel: DeviceChannel | None = None) -> tuple[float, datetime.timedelta, int]:
+    band = channel.alert_hysteresis if channel is not None else None
+    if band is None:
+        band = device.alert_hysteresis
+    if band is None:
+        band = settings.ALERT_HYSTERESIS
+    min_duration = device.alert_min_duration
+    if min_duration is None:
+        min_duration = settings.ALERT_MIN_DURATION
+    return band, datetime.timedelta(seconds=min_duration), max(1, settings.ALERT_DEBOUNCE_SAMPLES)
+
+
+def _classify(level: str, value: float, limit: float, band: float) -> str:
+    """返回 'breach'（越限）/ 'clear'（回到回差带外）/ 'band'（回差带内）。"""
+    if level == "HIGH":
+        if value > limit:
+            return "breach"
+        return "clear" if value <= limit - band else "band"
+    if value < limit:
+        return "breach"
+    return "clear" if value >= limit + band else "band"
+
+
+def evaluate(device: Device, edge: EdgeData, channels: list[DeviceChannel] | None = None) -> list[Alert]:
+    """
+    对一条新样本评估各通道的 HIGH / LOW 两个方向，返回本次新开的告警。需在事务内调用。
+    channels 为设备已登记的附加通道（样本带 channel_values 时传入，省一次查询）；缺测的通道跳过。
+    设备的状态行每次上报只读一次（加锁），各通道各方向在内存里推进，变化的状态行一次 bulk_update 写回。
+    """
+    targets = [(0, None, edge.sensor_value, device.threshold_hi, device.threshold_lo, None)]
+    if edge.channel_values:
+        if channels is None:
+            channels = list(device.channels.all())
+        values = unpack_channels(edge.channel_values)
+        for ch in channels:
+            value = values[ch.index - 1] if ch.index <= len(values) else None
+            if value is not None:
+                targets.append((ch.index, ch.name, value, ch.threshold_hi, ch.threshold_lo, ch))
+
+    checks = []
+    for channel, name, value, hi, lo, ch in targets:
+        band, min_duration, debounce = _config(device, ch)
+        for level, limit in (("HIGH", hi), ("LOW", lo)):
+            if limit is not None:
+                kind = _classify(level, value, limit, band)
+                checks.append((channel, name, value, level, limit, kind, min_duration, debounce))
+    if not checks:
+        return []
+
+    states = AlertState.objects.filter(device=device)
+    if all(c[5] != "breach" for c in checks):
+        # 常见路径：未越限且没有进行中的事件，只有一次不加锁的查询
+        if not states.filter(state__in=["PENDING", "OPEN"]).exists():
+            return []
+    by_key = {(st.channel, st.level): st for st in states.select_for_update()}
+
+    opened, dirty = [], []
+    for channel, name, value, level, limit, kind, min_duration, debounce in checks:
+        st = by_key.get((channel, level))
+        if st is None:
+            if kind != "breach":
+                continue
+            # 该通道该方向首次越限才建状态行
+            st, _ = AlertState.objects.get_or_create(device=device, level=level, channel=channel)
+        changed, alert = _step(device, edge, st, channel, name, value, level, limit, kind, min_duration, debounce)
+        if changed:
+            dirty.append(st)
+        if alert is not None:
+            opened.append(alert)
+
+    if dirty:
+        now = timezone.now()
+        for st in dirty:
+            st.updated_at = now
+        AlertState.objects.bulk_update(dirty, ["state", "since", "samples", "alert", "updated_at"])
+    return opened
+
+
+def _step(device, edge, st, channel, name, value, level, limit, kind, min_duration, debounce):
+    """推进一个（通道, 方向）的状态机，只修改内存中的 st。返回 (st 是否有变化, 新开的告警或 None)。"""
+    if kind != "breach":
+        if st.state == "CLEARED" or (st.state == "OPEN" and kind == "band"):
+            return False, None
+        if st.state == "OPEN" and st.alert_id:
+            Alert.objects.filter(pk=st.alert_id).update(state="CLEARED", cleared_at=edge.ts)
+        st.state, st.since, st.samples, st.alert = "CLEARED", None, 0, None
+        return True, None
+
+    if st.state == "OPEN" and st.alert_id:
+        Alert.objects.filter(pk=st.alert_id).update(
+            count=F("count") + 1, last_value=value, last_ts=edge.ts)
+        return False, None
+
+    if st.state != "PENDING":
+        st.state, st.since, st.samples = "PENDING", edge.ts, 0
+    st.samples += 1
+
+    alert = None
+    if st.samples >= debounce and edge.ts - st.since >= min_duration:
+        word = "高于上限" if level == "HIGH" else "低于下限"
+        subject = f"{device.device_code} {name}" if name else device.device_code
+        alert = Alert.objects.create(
+            device=device, edge_data=edge, level=level, channel=channel, state="OPEN", ts=edge.ts,
+            message=f"{subject} {word} {limit}：{value}",
+            count=st.samples, last_value=value, last_ts=edge.ts,
+        )
+        st.state, st.alert = "OPEN", alert
+        metrics.inc("iot_alerts_opened_total", level=level)
+    return True, alert
@@ -0,0 +1,51 @@
+# iotcore/channels.py
+"""
+多通道样本：一次上报携带多个量（温度 / 湿度 / 电压…），只写一行 edge_data。
+- 通道 0 是设备主量：沿用 sensor_value 列与 Device 上的 sensor_type / unit / threshold_*；
+- 通道 1..N 登记在 DeviceChannel（名称、单位、各自的阈值），数值打包成 float64 小端数组存进 channel_values，
+  第 i 个通道在偏移 8 * (i - 1) 处，缺测写 NaN；单通道设备 channel_values 为 NULL，没有额外开销；
+- 同步到 cloud_data 时由触发器 trg_cloud_channel_values（迁移 0008）带上 channel_values，序列 / 日报 / 告警按通道解包。
+"""
+from __future__ import annotations
+
+import math
+import struct
+import sys
+from array import array
+from typing import Optional
+
+_F64 = struct.Struct("<d")
+
+
+def pack_channels(values: list[Optional[float]]) -> Optional[bytes]:
+    """通道 1..N 的值 -> channel_values；None 记为 NaN，全空返回 None。"""
+    if not values or all(v is None for v in values):
+        return None
+    arr = array("d", (math.nan if v is None else float(v) for v in values))
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def unpack_channels(blob) -> list[Optional[float]]:
+    """channel_values -> [通道 1 的值, 通道 2 的值, ...]，NaN 还原为 None。"""
+    if not blob:
+        return []
+    arr = array("d", bytes(blob))
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return [None if math.isnan(v) else v for v in arr]
+
+
+def channel_value(blob, index: int) -> Optional[float]:
+    """取单个通道的值（index >= 1）；未上报或缺测返回 None。"""
+    offset = 8 * (index - 1)
+    if not blob or index < 1 or len(blob) < offset + 8:
+        return None
+    v = _F64.unpack_from(blob, offset)[0]
+    return None if math.isnan(v) else v
+
+
+def sample_value(sensor_value: float, blob, index: int) -> Optional[float]:
+    """按通道号取样本值：通道 0 为 sensor_value，其余从 channel_values 解包。"""
+    return sensor_value if index == 0 else channel_value(blob, index)
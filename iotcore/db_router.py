@@ -0,0 +1,169 @@
+# iotcore/db_router.py
+"""
+读写分离路由：
+- 写入一律走 default（主库）；
+- 只有显式标记的只读视图（@replica_read / ReplicaReadMixin）才把读分到 settings.DB_REPLICAS；
+- 副本延迟超过 DB_REPLICA_MAX_LAG 时自动读回主库；
+- 同一请求内发生过写入、或客户端在 DB_REPLICA_PIN_SECONDS 内写过（cookie），读主库（read-your-writes）。
+"""
+from __future__ import annotations
+
+import functools
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = "iot_db_pin"
+
+_replica_reads = ContextVar("iot_replica_reads", default=False)
+_pinned = ContextVar("iot_db_pinned", default=False)
+_wrote = ContextVar("iot_db_wrote", default=False)
+
+# alias -> (探测时刻, 延迟秒数；None 表示复制中断/不可用)
+_lag_cache: dict[str, tuple[float, float | None]] = {}
+_probe_failed: set[str] = set()    # 已记录过探测失败的副本，每个只报一次
+
+
+# =========================
+# 副本延迟探测
+# =========================
+def replica_lag(alias: str) -> float | None:
+    """返回副本延迟（秒），结果缓存 DB_REPLICA_LAG_CHECK_INTERVAL 秒。"""
+    now = time.monotonic()
+    cached = _lag_cache.get(alias)
+    if cached and now - cached[0] < settings.DB_REPLICA_LAG_CHECK_INTERVAL:
+        return cached[1]
+
+    lag = _probe_lag(alias)
+    _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def _probe_lag(alias: str) -> float | None:
+    conn = connections[alias]
+    if conn.vendor != "mysql":
+        return 0.0
+    try:
+        with conn.cursor() as cur:
+            try:
+                cur.execute("SHOW REPLICA STATUS")   # MySQL 8.0.22+
+            except Exception:
+                cur.execute("SHOW SLAVE STATUS")
+            row = cur.fetchone()
+            if row is None:          # 未配置复制：当作无延迟的只读实例
+                return 0.0
+            cols = [c[0] for c in cur.description]
+    except Exception as e:
+        # 常见原因是账号缺少 REPLICATION CLIENT 权限：此时所有副本都会被当作不可用、读回主库
+        if alias not in _probe_failed:
+            _probe_failed.add(alias)
+            logger.warning("replica lag probe on %r failed, treating it as unavailable "
+                           "(the DB user needs the REPLICATION CLIENT privilege): %s", alias, e)
+        return None
+    _probe_failed.discard(alias)
+
+    status = dict(zip(cols, row))
+    lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+    return None if lag is None else float(lag)
+
+
+def _pick_replica() -> str | None:
+    healthy = []
+    for alias in settings.DB_REPLICAS:
+        lag = replica_lag(alias)
+        if lag is not None and lag <= settings.DB_REPLICA_MAX_LAG:
+            healthy.append(alias)
+    return random.choice(healthy) if healthy else None
+
+
+# =========================
+# Router
+# =========================
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or _pinned.get() or _wrote.get():
+            return DEFAULT_DB_ALIAS
+        if not settings.DB_REPLICAS or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return _pick_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        dbs = {DEFAULT_DB_ALIAS, *settings.DB_REPLICAS}
+        if obj1._state.db in dbs and obj2._state.db in dbs:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+# =========================
+# 只读标记
+# =========================
+@contextmanager
+def reading_from_replica():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_read(view):
+    """函数视图装饰器（放在 @api_view 外层）：视图内的读可走副本。"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with reading_from_replica():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaReadMixin:
+    """ViewSet/APIView 混入：整个 dispatch 的读可走副本。"""
+    def dispatch(self, request, *args, **kwargs):
+        with reading_from_replica():
+            return super().dispatch(request, *args, **kwargs)
+
+
+# =========================
+# Middleware：read-your-writes
+# =========================
+class ReplicaPinMiddleware:
+    """
+    写入后给客户端种一个短期 cookie，在 DB_REPLICA_PIN_SECONDS 内该客户端的读都走主库，
+    避免“刚提交的数据在副本上还看不到”。未配置副本时不启用。
+    """
+    def __init__(self, get_response):
+        if not settings.DB_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        pin_token = _pinned.set(pinned)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get():
+                ttl = settings.DB_REPLICA_PIN_SECONDS
+                response.set_cookie(PIN_COOKIE, str(time.time() + ttl),
+                                    max_age=ttl, httponly=True, samesite="Lax")
+            return response
+        finally:
+            _wrote.reset(wrote_token)
+            _pinned.reset(pin_token)
@@ -0,0 +1,254 @@
+# iotcore/jobs.py
+"""
+后台任务：把“队列 → cloud_data”同步与日报生成从请求线程挪到 worker 池。
+- submit() 落一条 Job 记录并立即返回，线程池异步执行；
+- 同一 kind（日报为同一 kind + 日期）同时只跑一个：MySQL 用 GET_LOCK 咨询锁（跨进程/跨机器），其他库退化为进程内锁；
+- 执行过程中回写 progress / rows_processed，GET /api/jobs/<id>/ 可查看；
+- 运行中定期刷新 heartbeat_at，worker 重启 / 重新部署遗留的 queued/running 任务由 reap_orphans() 标记为 failed。
+"""
+from __future__ import annotations
+
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metrics, reports
+from .models import DailySummary, Job, SyncQueue
+
+logger = logging.getLogger(__name__)
+
+_HANDLERS = {}
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_local_locks: dict[str, threading.Lock] = {}
+
+
+def job_handler(kind: str):
+    def register(fn):
+        _HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IOT_JOB_WORKERS,
+                                           thread_name_prefix="iot-job")
+    return _executor
+
+
+# =========================
+# 咨询锁：同一 kind（+ 日期）同时只执行一个
+# =========================
+@contextmanager
+def advisory_lock(name: str):
+    """非阻塞获取锁，yield 是否拿到。"""
+    if connection.vendor == "mysql":
+        with connection.cursor() as cur:
+            cur.execute("SELECT GET_LOCK(%s, 0)", [name])
+            got = cur.fetchone()[0] == 1
+        try:
+            yield got
+        finally:
+            if got:
+                with connection.cursor() as cur:
+                    cur.execute("SELECT RELEASE_LOCK(%s)", [name])
+        return
+
+    lock = _local_locks.setdefault(name, threading.Lock())
+    got = lock.acquire(blocking=False)
+    try:
+        yield got
+    finally:
+        if got:
+            lock.release()
+
+
+# =========================
+# 提交 / 执行
+# =========================
+def submit(kind: str, params: dict | None = None) -> Job:
+    """创建 Job 并在事务提交后交给线程池，立即返回。"""
+    reap_orphans()
+    job = Job.objects.create(kind=kind, params=params or {})
+    transaction.on_commit(lambda: _get_executor().submit(_run_in_worker, job.id))
+    return job
+
+
+def _run_in_worker(job_id: int):
+    close_old_connections()
+    try:
+        run_job(job_id)
+    finally:
+        connection.close()   # worker 线程的连接不跨任务保留
+
+
+def run_job(job_id: int) -> Job:
+    """在当前线程执行任务（worker 池与调度器共用）。"""
+    job = Job.objects.get(pk=job_id)
+    handler = _HANDLERS[job.kind]
+    name = lock_name(job)
+    with advisory_lock(name) as got:
+        if not got:
+            _finish(job, "skipped", error=f"another job holding {name} is running")
+            return job
+        job.status = "running"
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.save(update_fields=["status", "started_at", "heartbeat_at"])
+        try:
+            with _heartbeat(job):
+                handler(job, job.params or {})
+        except Exception as e:
+            _finish(job, "failed", error=str(e)[:512])
+        else:
+            _finish(job, "succeeded", progress=1.0)
+    return job
+
+
+def lock_name(job: Job) -> str:
+    """同一 kind 串行执行；带 day 参数的任务（日报）按 kind + 日期加锁，不同日期互不影响。"""
+    day = (job.params or {}).get("day")
+    return f"iot_job:{job.kind}:{day}" if day else f"iot_job:{job.kind}"
+
+
+def _finish(job: Job, status: str, **fields):
+    job.status = status
+    job.finished_at = timezone.now()
+    for k, v in fields.items():
+        setattr(job, k, v)
+    job.save(update_fields=["status", "finished_at", *fields])
+
+
+@contextmanager
+def _heartbeat(job: Job):
+    """执行期间由后台线程每 settings.IOT_JOB_HEARTBEAT 秒刷新 heartbeat_at（存储过程单次调用可能很久没有进度回写）。"""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.IOT_JOB_HEARTBEAT):
+                try:
+                    Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now())
+                except Exception:
+                    logger.exception("job #%s heartbeat failed", job.pk)
+        finally:
+            connection.close()
+
+    t = threading.Thread(target=beat, name=f"iot-job-heartbeat-{job.pk}", daemon=True)
+    t.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        t.join()
+
+
+def reap_orphans() -> int:
+    """
+    把 worker 退出后遗留的 sync / 日报任务标记为 failed，返回处理条数：
+    running 且心跳超过 settings.IOT_JOB_STALE_AFTER 秒未刷新，或 queued 超过同样时长仍未开始。
+    backfill 由命令行前台执行，中断后本来就停在 running 等待 --resume，不在此处理。
+    """
+    now = timezone.now()
+    cutoff = now - datetime.timedelta(seconds=settings.IOT_JOB_STALE_AFTER)
+    stale = (Q(status="running", heartbeat_at__lt=cutoff)
+             | Q(status="running", heartbeat_at__isnull=True, started_at__lt=cutoff)
+             | Q(status="queued", created_at__lt=cutoff))
+    n = Job.objects.filter(stale, kind__in=list(_HANDLERS)).update(
+        status="failed", finished_at=now, error="orphaned: worker exited before the job finished")
+    if n:
+        logger.warning("marked %d orphaned job(s) as failed", n)
+    return n
+
+
+def report_progress(job: Job, *, rows_processed: int, progress: float):
+    job.rows_processed = rows_processed
+    job.progress = max(0.0, min(progress, 1.0))
+    Job.objects.filter(pk=job.pk).update(rows_processed=job.rows_processed, progress=job.progress)
+
+
+# =========================
+# Handlers
+# =========================
+@job_handler("sync")
+def sync_to_cloud(job: Job, params: dict):
+    """
+    分批调用 PROC_sync_to_cloud，直到启动时已在队列里的数据排空、某一批不满 batch，或达到批次上限。
+    每批调用前取队列头 batch 个 id（不超过启动时的队尾），调用后数其中已出队的条数作为搬运行数：
+    只统计本任务从 sync_queue 搬走的行，不会把同时进行的 backfill --target cloud 写入算进来。
+    进度按启动时队列的 id 区间估算（自增 id 可能有空洞，只影响进度显示）。
+    """
+    batch = int(params.get("batch", settings.IOT_SYNC_BATCH))
+    head, target = _min_id(SyncQueue), _max_id(SyncQueue)
+    if head is None:
+        return
+    depth = target - head + 1
+    moved = 0
+    for _ in range(settings.IOT_SYNC_MAX_BATCHES):
+        ids = list(SyncQueue.objects.filter(id__lte=target).order_by("id").values_list("id", flat=True)[:batch])
+        if not ids:
+            break
+        with connection.cursor() as cur:
+            cur.execute("CALL PROC_sync_to_cloud(%s)", [batch])
+        done = len(ids) - SyncQueue.objects.filter(id__in=ids).count()
+        if done > 0:
+            moved += done
+            metrics.inc("iot_sync_rows_total", done)
+            report_progress(job, rows_processed=moved, progress=moved / depth)
+        if done < len(ids) or len(ids) < batch:
+            break
+
+
+def _min_id(model) -> int | None:
+    return model.objects.order_by("id").values_list("id", flat=True).first()
+
+
+def _max_id(model) -> int:
+    return model.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+@job_handler("daily_report")
+def generate_report(job: Job, params: dict):
+    """
+    调用 PROC_generate_report（通道 0），再补齐多通道设备的附加通道与缺失的分位数草图；
+    params.day 缺省为今天（本地日期）。
+    """
+    day = params.get("day") or timezone.localdate().isoformat()
+    with connection.cursor() as cur:
+        cur.execute("CALL PROC_generate_report(%s)", [day])
+    d = datetime.date.fromisoformat(day)
+    reports.rebuild_daily_summary(d, d, primary=False)
+    reports.fill_missing_sketches(d)
+    report_progress(job, rows_processed=DailySummary.objects.filter(day=day).count(), progress=1.0)
+
+
+# =========================
+# 调度：按队列深度选择同步间隔
+# =========================
+def pick_sync_interval(depth: int) -> int:
+    """settings.IOT_SYNC_INTERVALS: [(最小队列深度, 间隔秒), ...]，取满足条件的最大深度档。"""
+    tiers = sorted(settings.IOT_SYNC_INTERVALS)
+    interval = tiers[0][1]
+    for min_depth, seconds in tiers:
+        if depth >= min_depth:
+            interval = seconds
+    return interval
+
+
+def next_report_at(now: datetime.datetime) -> datetime.datetime:
+    """下一次日报时刻（本地时间 settings.IOT_DAILY_REPORT_AT，如 "00:05"）。"""
+    hh, mm = map(int, settings.IOT_DAILY_REPORT_AT.split(":"))
+    local = timezone.localtime(now)
+    at = local.replace(hour=hh, minute=mm, second=0, microsecond=0)
+    if at <= local:
+        at += datetime.timedelta(days=1)
+    return at
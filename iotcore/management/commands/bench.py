@@ -0,0 +1,263 @@
+"""
+接口基准测试：在临时测试库（SQLite 或测试 MySQL）里生成合成设备数据，逐个接口测延迟与查询数。
+    IOT_DB_ENGINE=sqlite python manage.py bench --devices 10 --days 3 --hz 0.05
+    python manage.py bench --output bench.json --budgets iotcore/bench_budgets.json --baseline last.json
+输出每个用例的 p50/p95/p99（毫秒）、每请求查询数、rows/sec，写入 JSON；
+超出预算（budgets）时以非零状态退出，便于 CI 比较。
+"""
+import datetime
+import json
+import platform
+import random
+import statistics
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from iotcore.models import Alert, CloudData, DailySummary, Device, EdgeData
+from iotcore.sketches import DDSketch
+
+DEFAULT_BUDGETS = Path(__file__).resolve().parents[2] / "bench_budgets.json"
+BATCH = 5000
+
+
+class Command(BaseCommand):
+    help = "在临时测试库上对 upload / series / 告警 / ViewSet 接口做基准测试，结果写 JSON 并对照预算"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--devices", type=int, default=10, help="合成设备数")
+        parser.add_argument("--days", type=int, default=3, help="每台设备的历史天数")
+        parser.add_argument("--hz", type=float, default=0.05, help="每台设备的采样率（点/秒）")
+        parser.add_argument("--sizes", default="100,1000,5000", help="序列接口的数据量档位（点数）")
+        parser.add_argument("--iterations", type=int, default=30, help="每个用例的测量次数")
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", default="bench_results.json")
+        parser.add_argument("--budgets", default=str(DEFAULT_BUDGETS), help="预算文件；传空字符串跳过")
+        parser.add_argument("--baseline", help="上一次的结果 JSON，输出 p95 变化")
+        parser.add_argument("--keepdb", action="store_true", help="保留测试库（复用已生成的数据）")
+
+    def handle(self, *args, **opts):
+        random.seed(opts["seed"])
+        sizes = [int(x) for x in opts["sizes"].split(",") if x]
+
+        setup_test_environment()
+        conn = connections["default"]
+        old_name = conn.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=opts["keepdb"])
+        try:
+            t0 = time.perf_counter()
+            fleet = self._seed(opts["devices"], opts["days"], opts["hz"])
+            self.stdout.write(f"seeded {fleet['rows']} cloud rows in {time.perf_counter() - t0:.1f}s")
+            results = self._run_cases(fleet, sizes, opts["iterations"], opts["warmup"])
+        finally:
+            conn.creation.destroy_test_db(old_name, verbosity=0, keepdb=opts["keepdb"])
+            teardown_test_environment()
+
+        report = {
+            "meta": {
+                "started_at": timezone.now().isoformat(),
+                "db_vendor": conn.vendor,
+                "python": platform.python_version(),
+                "devices": opts["devices"], "days": opts["days"], "hz": opts["hz"],
+                "cloud_rows": fleet["rows"], "iterations": opts["iterations"],
+            },
+            "results": results,
+        }
+        report["violations"] = self._check_budgets(results, opts["budgets"])
+        Path(opts["output"]).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+        self._print(results, opts.get("baseline"))
+        self.stdout.write(f"results written to {opts['output']}")
+        if report["violations"]:
+            for v in report["violations"]:
+                self.stderr.write(f"BUDGET {v}")
+            raise CommandError(f"{len(report['violations'])} budget violation(s)")
+
+    # =========================
+    # 合成数据
+    # =========================
+    def _seed(self, n_devices: int, days: int, hz: float) -> dict:
+        existing = list(Device.objects.filter(device_code__startswith="BENCH-"))
+        if existing:   # --keepdb 复用
+            last = CloudData.objects.order_by("-ts").values_list("ts", flat=True).first()
+            return {"devices": existing, "rows": CloudData.objects.count(), "end": last, "hz": hz}
+
+        Device.objects.bulk_create([
+            Device(device_code=f"BENCH-{i:05d}", device_name=f"bench {i}", location=f"site-{i % 5}",
+                   protocol=random.choice(["http", "mqtt", "modbus"]), threshold_hi=30, threshold_lo=10,
+                   sampling_hz=hz)
+            for i in range(n_devices)
+        ])
+        devices = list(Device.objects.filter(device_code__startswith="BENCH-").order_by("id"))
+
+        end = timezone.now().replace(microsecond=0)
+        start = end - datetime.timedelta(days=days)
+        step = datetime.timedelta(seconds=1 / hz)
+        rows = 0
+        for dev in devices:
+            buf, ts = [], start
+            while ts < end:
+                buf.append(CloudData(device_id=dev.id, sensor_value=round(random.gauss(22, 5), 2), ts=ts))
+                ts += step
+                if len(buf) >= BATCH:
+                    CloudData.objects.bulk_create(buf)
+                    rows += len(buf)
+                    buf = []
+            CloudData.objects.bulk_create(buf)
+            rows += len(buf)
+
+            DailySummary.objects.bulk_create([
+                DailySummary(day=(end - datetime.timedelta(days=d)).date(), device_id=dev.id,
+                             count_records=int(86400 * hz), avg_value=22, max_value=35, min_value=8,
+                             alert_count=random.randint(0, 5), sketch=_day_sketch(int(86400 * hz)))
+                for d in range(days)
+            ])
+            edges = EdgeData.objects.bulk_create([
+                EdgeData(device=dev, sensor_value=31 + random.random(), raw_value=31, quality=1)
+                for _ in range(50)
+            ])
+            if not edges[0].pk:   # 不支持 RETURNING 的后端（MySQL）重新取 id
+                edges = list(EdgeData.objects.filter(device=dev).order_by("-id")[:50])
+            Alert.objects.bulk_create([
+                Alert(device=dev, edge_data=e, level="HIGH", state="CLEARED", count=random.randint(1, 20),
+                      last_value=e.sensor_value, message="bench")
+                for e in edges
+            ])
+        return {"devices": devices, "rows": rows, "end": end, "hz": hz}
+
+    # =========================
+    # 用例
+    # =========================
+    def _cases(self, fleet: dict, sizes: list[int]):
+        devices = fleet["devices"]
+        code = lambda: random.choice(devices).device_code
+        end_local = timezone.localtime(fleet["end"]).replace(tzinfo=None)
+
+        def upload():
+            return "post", "/api/data/upload/", {"device_code": code(), "sensor_value": round(random.gauss(22, 5), 2)}
+
+        yield "upload_data", upload, 1
+        for n in sizes:
+            yield (f"cloud_series_raw_{n}",
+                   lambda n=n: ("get", f"/api/cloud/series?device_code={code()}&limit={n}", None), n)
+            span = datetime.timedelta(seconds=n / fleet["hz"])
+            frm = (end_local - span).strftime("%Y-%m-%dT%H:%M:%S")
+            to = end_local.strftime("%Y-%m-%dT%H:%M:%S")
+            yield (f"cloud_series_ranged_{n}",
+                   lambda frm=frm, to=to: ("get", f"/api/cloud/series?device_code={code()}&from={frm}&to={to}&limit=5000", None),
+                   n)
+        yield "daily_series", lambda: ("get", f"/api/report/daily/series?device_code={code()}&days=7", None), 7
+        yield ("report_percentiles",
+               lambda: ("get", "/api/report/percentiles?days=30&group_by=location", None), 5)
+        yield "recent_alerts", lambda: ("get", f"/api/alerts/recent/?device_code={code()}&limit=50", None), 50
+        yield "devices_list", lambda: ("get", "/api/devices/", None), len(devices)
+        yield "alerts_list", lambda: ("get", "/api/alerts/", None), Alert.objects.count()
+        yield "report_daily_list", lambda: ("get", "/api/report/daily/", None), DailySummary.objects.count()
+
+    def _run_cases(self, fleet, sizes, iterations, warmup) -> dict:
+        client = Client()
+        results = {}
+        for name, make, rows in self._cases(fleet, sizes):
+            for _ in range(warmup):
+                self._request(client, make())
+            lat, queries, counts = [], [], []
+            for _ in range(iterations):
+                with ExitStack() as stack:
+                    ctxs = [stack.enter_context(CaptureQueriesContext(connections[a])) for a in connections]
+                    t0 = time.perf_counter()
+                    resp = self._request(client, make())
+                    lat.append((time.perf_counter() - t0) * 1000)
+                queries.append(sum(len(c.captured_queries) for c in ctxs))
+                if resp.status_code >= 400:
+                    raise CommandError(f"{name}: HTTP {resp.status_code} {resp.content[:200]!r}")
+                counts.append(_rows_in(resp, rows))
+            results[name] = _summarize(lat, queries, statistics.fmean(counts))
+        return results
+
+    @staticmethod
+    def _request(client, req):
+        method, url, body = req
+        if method == "post":
+            return client.post(url, body, content_type="application/json")
+        return client.get(url)
+
+    # =========================
+    # 预算 / 输出
+    # =========================
+    def _check_budgets(self, results: dict, path: str | None) -> list[str]:
+        if not path:
+            return []
+        budgets = json.loads(Path(path).read_text())
+        violations = []
+        for name, limits in budgets.items():
+            r = results.get(name)
+            if r is None:
+                continue
+            for key, limit in limits.items():
+                if key.startswith("min_"):
+                    actual = r.get(key[4:])
+                    if actual is not None and actual < limit:
+                        violations.append(f"{name}.{key[4:]} = {actual} < {limit}")
+                else:
+                    actual = r.get(key)
+                    if actual is not None and actual > limit:
+                        violations.append(f"{name}.{key} = {actual} > {limit}")
+        return violations
+
+    def _print(self, results: dict, baseline_path: str | None):
+        baseline = {}
+        if baseline_path:
+            baseline = json.loads(Path(baseline_path).read_text()).get("results", {})
+        self.stdout.write(f"{'case':<28}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}{'rows/s':>12}{'Δp95':>9}")
+        for name, r in results.items():
+            delta = ""
+            if name in baseline and baseline[name]["p95_ms"]:
+                delta = f"{(r['p95_ms'] / baseline[name]['p95_ms'] - 1) * 100:+.0f}%"
+            self.stdout.write(f"{name:<28}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+                              f"{r['queries']:>9.1f}{r['rows_per_sec']:>12.0f}{delta:>9}")
+
+
+def _day_sketch(n: int) -> bytes:
+    sk = DDSketch()
+    for _ in range(min(n, 2000)):
+        sk.add(random.gauss(22, 5))
+    return sk.to_bytes()
+
+
+def _rows_in(resp, default: int) -> int:
+    """响应里实际返回的行数（行式列表 / 列式 {"ts": [...]}），其他情况用用例的标称行数。"""
+    if resp.get("Content-Type", "").startswith("application/json"):
+        data = json.loads(resp.content)
+        if isinstance(data, list):
+            return len(data)
+        if isinstance(data, dict) and isinstance(data.get("ts"), list):
+            return len(data["ts"])
+    return default
+
+
+def _percentile(sorted_vals: list[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def _summarize(lat: list[float], queries: list[int], rows: float) -> dict:
+    s = sorted(lat)
+    mean = statistics.fmean(s)
+    return {
+        "p50_ms": round(_percentile(s, 50), 3),
+        "p95_ms": round(_percentile(s, 95), 3),
+        "p99_ms": round(_percentile(s, 99), 3),
+        "mean_ms": round(mean, 3),
+        "queries": round(statistics.fmean(queries), 2),
+        "rows": round(rows, 1),
+        "rows_per_sec": round(rows / (mean / 1000), 1) if mean else 0.0,
+    }
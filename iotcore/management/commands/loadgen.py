@@ -0,0 +1,330 @@
+"""
+模拟设备群压测：对本地/测试服务器按目标速率回放上报与看板轮询流量，逐级加压直到饱和。
+    python manage.py loadgen --base-url http://127.0.0.1:8000 --devices 10000 --create-devices
+    python manage.py loadgen --start-rate 200 --max-rate 20000 --step-factor 1.5 --workers 4 --output load.json
+- 上报：设备按 sampling_hz 混合分布加权选取，带突发（一次连发多条）与 source_ts 时钟偏差；
+- 读取：--dashboards 个虚拟看板按 cloud_dashboard.html 的节奏轮询（10s 刷新阈值/序列/日报，1.5s 拉告警）；
+- 每档持续 --step-seconds 秒（开环发送，排队等待计入延迟），达不到目标速率 / 错误率或 p95 超限即判定饱和；
+- 输出每档每个接口的吞吐、错误率、p50/p95/p99，以及最后一个未饱和档的持续吞吐。
+"""
+import asyncio
+import datetime
+import itertools
+import json
+import multiprocessing
+import random
+import statistics
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# =========================
+# 设备群
+# =========================
+def _parse_mix(spec: str) -> list[tuple[float, float]]:
+    """"0.1:0.6,1:0.3,10:0.1" -> [(hz, 占比), ...]"""
+    mix = []
+    for part in spec.split(","):
+        hz, _, weight = part.partition(":")
+        mix.append((float(hz), float(weight or 1)))
+    return mix
+
+
+def build_fleet(n: int, prefix: str, mix: list[tuple[float, float]], skew: float, seed: int) -> list[dict]:
+    """确定性生成设备清单（同一 seed 在主进程与各 worker 中一致）。"""
+    rnd = random.Random(seed)
+    hz_values, weights = zip(*mix)
+    return [{
+        "code": f"{prefix}{i:05d}",
+        "hz": rnd.choices(hz_values, weights)[0],
+        "skew": rnd.uniform(-skew, skew),          # 设备时钟偏差（秒）
+    } for i in range(n)]
+
+
+# =========================
+# 最小 HTTP/1.1 客户端（keep-alive）
+# =========================
+class _Conn:
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes | None = None) -> int:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: keep-alive"]
+        if body is not None:
+            head += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        try:
+            self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + (body or b""))
+            await self.writer.drain()
+            status, keep_alive = await self._read_response()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            self.close()
+            raise
+        if not keep_alive:
+            self.close()
+        return status
+
+    async def _read_response(self) -> tuple[int, bool]:
+        status_line = await self.reader.readuntil(b"\r\n")
+        version, status = status_line.split(b" ", 2)[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif "content-length" in headers:
+            await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            await self.reader.read()   # 无长度：读到连接关闭
+            return int(status), False
+
+        keep_alive = headers.get("connection", "").lower() != "close" and version == b"HTTP/1.1"
+        return int(status), keep_alive
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+# =========================
+# 单个 worker 进程跑一档
+# =========================
+class _Stage:
+    def __init__(self, cfg: dict, rate: float, seed: int):
+        self.cfg, self.rate = cfg, rate
+        self.rnd = random.Random(seed)
+        self.fleet = build_fleet(cfg["devices"], cfg["prefix"], cfg["mix"], cfg["skew"], cfg["seed"])
+        self.cum_weights = list(itertools.accumulate(d["hz"] for d in self.fleet))   # 只算一次，choices 按累计权重二分
+        url = urlsplit(cfg["base_url"])
+        self.host, self.port = url.hostname, url.port or 80
+        self.lat = defaultdict(list)       # endpoint -> [ms]
+        self.errors = defaultdict(int)     # endpoint -> 次数
+        self.sent = 0
+        self.inflight = 0
+        self.tasks = set()
+
+    async def run(self) -> dict:
+        self.pool = asyncio.Queue()
+        for _ in range(self.cfg["connections"]):
+            self.pool.put_nowait(_Conn(self.host, self.port))
+
+        deadline = time.monotonic() + self.cfg["step_seconds"]
+        tasks = [asyncio.create_task(self._dashboard(deadline)) for _ in range(self.cfg["dashboards"])]
+        await self._drive_uploads(deadline)
+        await asyncio.gather(*tasks)
+        while self.inflight:
+            await asyncio.sleep(0.05)
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
+        return {"lat": dict(self.lat), "errors": dict(self.errors), "sent": self.sent}
+
+    async def _call(self, endpoint: str, method: str, path: str, body: bytes | None = None):
+        self.inflight += 1
+        t0 = time.perf_counter()       # 含等待连接的排队时间
+        conn = await self.pool.get()
+        try:
+            status = await conn.request(method, path, body)
+            if status >= 400:
+                self.errors[endpoint] += 1
+        except Exception:
+            self.errors[endpoint] += 1
+        finally:
+            self.pool.put_nowait(conn)
+            self.lat[endpoint].append((time.perf_counter() - t0) * 1000)
+            self.inflight -= 1
+
+    def _upload_body(self, dev: dict) -> bytes:
+        src = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=dev["skew"] + self.rnd.gauss(0, 0.05))
+        return json.dumps({
+            "device_code": dev["code"],
+            "sensor_value": round(self.rnd.gauss(25, 4), 2),
+            "source_ts": src.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        }).encode()
+
+    async def _drive_uploads(self, deadline: float):
+        """开环发送：每 10ms 按目标速率补发，突发时同一设备连发 burst_size 条。"""
+        start = time.monotonic()
+        tick = 0.01
+        while (now := time.monotonic()) < deadline:
+            due = int((now - start) * self.rate) - self.sent
+            for _ in range(max(0, due)):
+                if self.inflight >= self.cfg["max_inflight"]:
+                    self.errors["upload_data(dropped)"] += 1
+                    self.sent += 1
+                    continue
+                dev = self.rnd.choices(self.fleet, cum_weights=self.cum_weights)[0]
+                n = self.cfg["burst_size"] if self.rnd.random() < self.cfg["burst_prob"] else 1
+                for _ in range(n):
+                    task = asyncio.create_task(self._call("upload_data", "POST", "/api/data/upload/",
+                                                          self._upload_body(dev)))
+                    self.tasks.add(task)               # 持有引用，避免任务被提前回收
+                    task.add_done_callback(self.tasks.discard)
+                self.sent += n
+            await asyncio.sleep(tick)
+
+    async def _dashboard(self, deadline: float):
+        """与 cloud_dashboard.html 相同的节奏：10s loadData（3 个并发请求）、1.5s pollAlerts。"""
+        code = self.rnd.choice(self.fleet)["code"]
+        q = urlencode({"device_code": code})
+        next_load = next_alerts = time.monotonic() + self.rnd.uniform(0, 1.5)
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            if now >= next_load:
+                next_load = now + 10
+                await asyncio.gather(
+                    self._call("device_thresholds", "GET", f"/api/dev/thresholds/?{q}"),
+                    self._call("cloud_series", "GET", f"/api/cloud/series?{q}"),
+                    self._call("daily_series", "GET", f"/api/report/daily/series?{q}&days=7"),
+                )
+            if now >= next_alerts:
+                next_alerts = now + 1.5
+                await self._call("recent_alerts", "GET", f"/api/alerts/recent/?{q}&limit=20")
+            await asyncio.sleep(max(0.0, min(next_load, next_alerts) - time.monotonic()))
+
+
+def _run_stage(args) -> dict:
+    cfg, rate, seed = args
+    return asyncio.run(_Stage(cfg, rate, seed).run())
+
+
+# =========================
+# 汇总
+# =========================
+def _pct(vals: list[float]) -> dict:
+    if len(vals) < 2:
+        v = vals[0] if vals else 0.0
+        return {"p50_ms": v, "p95_ms": v, "p99_ms": v}
+    q = statistics.quantiles(vals, n=100, method="inclusive")
+    return {"p50_ms": round(q[49], 2), "p95_ms": round(q[94], 2), "p99_ms": round(q[98], 2)}
+
+
+def _merge(parts: list[dict], seconds: float) -> dict:
+    lat, errors = defaultdict(list), defaultdict(int)
+    for p in parts:
+        for k, v in p["lat"].items():
+            lat[k].extend(v)
+        for k, v in p["errors"].items():
+            errors[k] += v
+    endpoints = {}
+    for name in sorted(set(lat) | set(errors)):
+        n = len(lat.get(name, []))
+        endpoints[name] = {
+            "requests": n,
+            "errors": errors.get(name, 0),
+            "error_rate": round(errors.get(name, 0) / n, 4) if n else 1.0,
+            "throughput_rps": round(n / seconds, 1),
+            **_pct(lat.get(name, [])),
+        }
+    return endpoints
+
+
+class Command(BaseCommand):
+    help = "模拟设备群与看板流量，对上报/读取接口逐级加压到饱和，报告吞吐、错误率与延迟分位数"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--devices", type=int, default=10000)
+        parser.add_argument("--prefix", default="SIM-", help="模拟设备编码前缀")
+        parser.add_argument("--hz-mix", default="0.1:0.6,1:0.3,10:0.1", help="sampling_hz:占比,...")
+        parser.add_argument("--skew", type=float, default=30.0, help="source_ts 最大时钟偏差（秒）")
+        parser.add_argument("--burst-prob", type=float, default=0.05, help="一次上报变成突发的概率")
+        parser.add_argument("--burst-size", type=int, default=20)
+        parser.add_argument("--dashboards", type=int, default=20, help="每个 worker 的虚拟看板数")
+        parser.add_argument("--start-rate", type=float, default=100, help="起始上报速率（条/秒）")
+        parser.add_argument("--max-rate", type=float, default=50000)
+        parser.add_argument("--step-factor", type=float, default=1.5, help="每档速率倍数")
+        parser.add_argument("--step-seconds", type=float, default=20)
+        parser.add_argument("--workers", type=int, default=1, help="发压进程数（asyncio 事件循环各一个）")
+        parser.add_argument("--connections", type=int, default=64, help="每个 worker 的 keep-alive 连接数")
+        parser.add_argument("--max-inflight", type=int, default=5000, help="每个 worker 未完成请求上限，超出记为 dropped")
+        parser.add_argument("--max-error-rate", type=float, default=0.01)
+        parser.add_argument("--max-p95", type=float, default=1000, help="上报 p95 超过该值（ms）判定饱和")
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument("--create-devices", action="store_true",
+                            help="先在当前 DATABASES 中批量创建缺失的模拟设备")
+        parser.add_argument("--output", help="结果 JSON 路径")
+
+    def handle(self, *args, **opts):
+        cfg = {
+            "base_url": opts["base_url"], "devices": opts["devices"], "prefix": opts["prefix"],
+            "mix": _parse_mix(opts["hz_mix"]), "skew": opts["skew"], "seed": opts["seed"],
+            "burst_prob": opts["burst_prob"], "burst_size": opts["burst_size"],
+            "dashboards": opts["dashboards"], "step_seconds": opts["step_seconds"],
+            "connections": opts["connections"], "max_inflight": opts["max_inflight"],
+        }
+        if opts["create_devices"]:
+            self._create_devices(cfg)
+
+        stages, sustained = [], None
+        rate = opts["start_rate"]
+        workers = max(1, opts["workers"])
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(workers) as pool:
+            while rate <= opts["max_rate"]:
+                parts = pool.map(_run_stage, [(cfg, rate / workers, opts["seed"] * 1000 + i + len(stages))
+                                              for i in range(workers)])
+                elapsed = opts["step_seconds"]
+                endpoints = _merge(parts, elapsed)
+                up = endpoints.get("upload_data", {"requests": 0, "error_rate": 1.0, "p95_ms": 0})
+                achieved = up["requests"] / elapsed
+                err_rate = sum(e["errors"] for e in endpoints.values()) / max(
+                    1, sum(e["requests"] for e in endpoints.values()))
+                saturated = (achieved < rate * 0.9 or err_rate > opts["max_error_rate"]
+                             or up["p95_ms"] > opts["max_p95"])
+                stage = {"target_rps": rate, "achieved_upload_rps": round(achieved, 1),
+                         "error_rate": round(err_rate, 4), "saturated": saturated, "endpoints": endpoints}
+                stages.append(stage)
+                self._print_stage(stage)
+                if saturated:
+                    break
+                sustained = stage
+                rate *= opts["step_factor"]
+
+        summary = {
+            "sustained_upload_rps": sustained["achieved_upload_rps"] if sustained else 0.0,
+            "sustained_stage": sustained,
+            "saturated_at_rps": stages[-1]["target_rps"] if stages and stages[-1]["saturated"] else None,
+            "stages": stages,
+        }
+        self.stdout.write(f"sustained upload throughput: {summary['sustained_upload_rps']} req/s")
+        if opts["output"]:
+            Path(opts["output"]).write_text(json.dumps(summary, indent=2, ensure_ascii=False))
+            self.stdout.write(f"results written to {opts['output']}")
+
+    def _create_devices(self, cfg: dict):
+        from iotcore.models import Device   # worker 进程以 spawn 启动、不初始化 Django，模型只在主进程导入
+        fleet = build_fleet(cfg["devices"], cfg["prefix"], cfg["mix"], cfg["skew"], cfg["seed"])
+        existing = set(Device.objects.filter(device_code__startswith=cfg["prefix"])
+                       .values_list("device_code", flat=True))
+        new = [Device(device_code=d["code"], device_name=f"sim {d['code']}", protocol="http",
+                      sampling_hz=d["hz"], threshold_hi=35, threshold_lo=5)
+               for d in fleet if d["code"] not in existing]
+        Device.objects.bulk_create(new, batch_size=1000)
+        self.stdout.write(f"created {len(new)} devices ({len(existing)} already present)")
+
+    def _print_stage(self, st: dict):
+        flag = "SATURATED" if st["saturated"] else "ok"
+        self.stdout.write(f"== target {st['target_rps']:.0f} rps -> upload {st['achieved_upload_rps']} rps, "
+                          f"errors {st['error_rate']:.2%} [{flag}]")
+        for name, e in st["endpoints"].items():
+            self.stdout.write(f"   {name:<22}{e['throughput_rps']:>9.1f} rps  err {e['error_rate']:>6.2%}  "
+                              f"p50 {e['p50_ms']:>8.1f}  p95 {e['p95_ms']:>8.1f}  p99 {e['p99_ms']:>8.1f} ms")
+        if not st["endpoints"]:
+            raise CommandError("no requests completed; is the server running?")
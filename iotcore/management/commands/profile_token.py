@@ -0,0 +1,23 @@
+"""
+生成请求剖析用的签名头：
+    python manage.py profile_token admin
+    curl -H "X-Iot-Profile: <token>" http://.../api/cloud/series?device_code=T-001
+需 settings.PROFILING_ENABLED；令牌有效期 PROFILING_TOKEN_MAX_AGE 秒，用户须为 staff。
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from iotcore.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = "为 staff 用户生成 X-Iot-Profile 请求头的签名令牌"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+
+    def handle(self, *args, **opts):
+        username = opts["username"]
+        if not get_user_model().objects.filter(username=username, is_staff=True, is_active=True).exists():
+            raise CommandError(f"'{username}' is not an active staff user")
+        self.stdout.write(make_token(username))
@@ -0,0 +1,73 @@
+"""
+内置调度器：取代 MySQL 事件 ev_sync_to_cloud / ev_daily_report。
+    python manage.py run_scheduler [--disable-db-events]
+- 同步间隔按 sync_queue 深度自适应（settings.IOT_SYNC_INTERVALS）；
+- 每天 settings.IOT_DAILY_REPORT_AT 生成前一天日报；
+- 任务以 Job 记录执行，与 API 触发的任务共用咨询锁，不会重复运行；
+- 每轮把 worker 重启遗留的 queued/running 任务标记为 failed（jobs.reap_orphans）。
+"""
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from iotcore import jobs
+from iotcore.models import Job, SyncQueue
+
+DB_EVENTS = ("ev_sync_to_cloud", "ev_daily_report")
+
+
+class Command(BaseCommand):
+    help = "按队列深度自适应地调度同步任务，并每日生成日报（取代 MySQL 事件调度）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--disable-db-events", action="store_true",
+                            help="启动时执行 ALTER EVENT ... DISABLE，停用 MySQL 中的同名事件")
+        parser.add_argument("--once", action="store_true", help="只执行一轮同步后退出")
+
+    def handle(self, *args, **opts):
+        if opts["disable_db_events"]:
+            self._disable_db_events()
+
+        next_sync = timezone.now()
+        next_report = jobs.next_report_at(timezone.now())
+        while True:
+            close_old_connections()
+            jobs.reap_orphans()
+            now = timezone.now()
+
+            if now >= next_sync:
+                depth = SyncQueue.objects.count()
+                job = self._run("sync")
+                interval = jobs.pick_sync_interval(depth)
+                next_sync = timezone.now() + datetime.timedelta(seconds=interval)
+                self.stdout.write(f"[sync] depth={depth} status={job.status} rows={job.rows_processed} "
+                                  f"duration={job.duration or 0:.2f}s next in {interval}s")
+                if opts["once"]:
+                    return
+
+            if now >= next_report:
+                day = (timezone.localtime(next_report) - datetime.timedelta(days=1)).date()
+                job = self._run("daily_report", {"day": day.isoformat()})
+                next_report = jobs.next_report_at(timezone.now())
+                self.stdout.write(f"[report] day={day} status={job.status} rows={job.rows_processed}")
+
+            wait = min(next_sync, next_report) - timezone.now()
+            time.sleep(max(0.5, min(wait.total_seconds(), 30)))
+
+    def _run(self, kind: str, params: dict | None = None) -> Job:
+        job = Job.objects.create(kind=kind, params=params or {})
+        return jobs.run_job(job.id)
+
+    def _disable_db_events(self):
+        if connection.vendor != "mysql":
+            return
+        with connection.cursor() as cur:
+            for ev in DB_EVENTS:
+                try:
+                    cur.execute(f"ALTER EVENT {ev} DISABLE")
+                    self.stdout.write(f"disabled event {ev}")
+                except Exception as e:
+                    self.stderr.write(f"skip event {ev}: {e}")
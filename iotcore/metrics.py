@@ -0,0 +1,312 @@
+# iotcore/metrics.py
+"""
+Prometheus 指标（不依赖 prometheus_client）：
+- 计数器 / 直方图存在进程内字典里，热路径只有一次加锁的字典更新；
+- 配置 settings.METRICS_DIR 时，后台线程每 METRICS_FLUSH_INTERVAL 秒（及进程退出时）把本进程快照写成 <pid>.json，
+  /metrics 汇总目录下所有 worker 的快照（gunicorn 多进程部署、run_scheduler 进程）；未配置则只导出本进程；
+- 已退出进程的快照在抓取时并入 _dead.json 后删除，文件数不随 worker 重启增长，计数器也不会回退；
+  目录只能由同一台机器上的进程共享（按 pid 判断存活）；
+- sync_queue 深度 / 排空延迟等库内状态在抓取时现查，不走热路径。
+"""
+from __future__ import annotations
+
+import atexit
+import bisect
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import SyncQueue
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+HISTOGRAMS = {
+    "iot_http_request_duration_seconds": LATENCY_BUCKETS,
+    "iot_db_queries_per_request": QUERY_BUCKETS,
+}
+HELP = {
+    "iot_http_request_duration_seconds": "请求耗时（按视图路由）",
+    "iot_http_requests_total": "请求数（按视图路由 / 方法 / 状态码段）",
+    "iot_db_queries_per_request": "单个请求的 SQL 条数",
+    "iot_db_query_seconds_total": "SQL 累计耗时",
+    "iot_ingest_samples_total": "上报样本数（按设备协议）",
+    "iot_ingest_errors_total": "上报失败数",
+    "iot_alerts_opened_total": "新开告警事件数",
+    "iot_sync_rows_total": "同步任务搬运到 cloud_data 的行数",
+    "iot_sync_queue_depth": "sync_queue 当前积压行数",
+    "iot_sync_queue_lag_seconds": "sync_queue 最早一行的等待时长",
+}
+
+_lock = threading.Lock()
+_counters: dict[tuple, float] = defaultdict(float)
+_histograms: dict[tuple, list] = {}          # key -> [各桶计数..., +Inf 计数, sum]
+_flusher_started = False
+
+DEAD_FILE = "_dead.json"     # 已退出 worker 的累计值
+
+
+# =========================
+# 记录（热路径）
+# =========================
+def inc(name: str, value: float = 1.0, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] += value
+    _ensure_flusher()
+
+
+def observe(name: str, value: float, **labels):
+    bounds = HISTOGRAMS[name]
+    key = (name, tuple(sorted(labels.items())))
+    idx = bisect.bisect_left(bounds, value)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(bounds) + 1) + [0.0]
+        h[idx] += 1
+        h[-1] += value
+    _ensure_flusher()
+
+
+# =========================
+# 多进程汇总
+# =========================
+def _snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": [[n, list(lbl), v] for (n, lbl), v in _counters.items()],
+            "histograms": [[n, list(lbl), list(h)] for (n, lbl), h in _histograms.items()],
+        }
+
+
+@contextmanager
+def _dir_lock(exclusive: bool):
+    """METRICS_DIR 上的文件锁：并入已退出进程的快照时独占，读取时共享，抓取不会看到重复或缺失的计数。"""
+    d = Path(settings.METRICS_DIR)
+    d.mkdir(parents=True, exist_ok=True)
+    with open(d / ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield d
+
+
+def _flush():
+    with _dir_lock(exclusive=False) as d:
+        tmp = d / f".{os.getpid()}.json.tmp"
+        tmp.write_text(json.dumps(_snapshot()))
+        tmp.replace(d / f"{os.getpid()}.json")
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            _flush()
+        except OSError:
+            logger.exception("metrics flush failed")
+
+
+def _flush_at_exit():
+    try:
+        _flush()
+    except OSError:
+        logger.exception("metrics flush failed")
+
+
+def _ensure_flusher():
+    global _flusher_started
+    if _flusher_started or not settings.METRICS_DIR:
+        return
+    with _lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+    try:
+        _prune_dead(own=True)    # 同 pid 的前任进程留下的快照，先并入再开始覆盖
+    except OSError:
+        logger.exception("metrics: pruning dead snapshots failed")
+    atexit.register(_flush_at_exit)
+    threading.Thread(target=_flush_loop, name="iot-metrics-flush", daemon=True).start()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_dead(pid: int, own: bool) -> bool:
+    return own if pid == os.getpid() else not _pid_alive(pid)
+
+
+def _prune_dead(own: bool = False):
+    """把已退出进程的 <pid>.json 并入 _dead.json 并删除；own=True 时本进程 pid 的文件也视为前任遗留。"""
+    with _dir_lock(exclusive=True) as d:
+        dead = [f for f in d.glob("*.json") if f.stem.isdecimal() and _is_dead(int(f.stem), own)]
+        if not dead:
+            return
+        archive = d / DEAD_FILE
+        snapshots = [_read(f) for f in [archive, *dead] if f.exists()]
+        counters, histograms = _merge([s for s in snapshots if s is not None])
+        tmp = d / f".{DEAD_FILE}.tmp"
+        tmp.write_text(json.dumps({
+            "counters": [[n, list(lbl), v] for (n, lbl), v in counters.items()],
+            "histograms": [[n, list(lbl), h] for (n, lbl), h in histograms.items()],
+        }))
+        tmp.replace(archive)
+        for f in dead:
+            f.unlink()
+
+
+def _read(f: Path) -> dict | None:
+    try:
+        return json.loads(f.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(snapshots: list[dict]) -> tuple[dict, dict]:
+    counters: dict[tuple, float] = defaultdict(float)
+    histograms: dict[tuple, list] = {}
+    for snap in snapshots:
+        for n, lbl, v in snap["counters"]:
+            counters[(n, tuple(map(tuple, lbl)))] += v
+        for n, lbl, h in snap["histograms"]:
+            key = (n, tuple(map(tuple, lbl)))
+            acc = histograms.setdefault(key, [0] * len(h))
+            for i, x in enumerate(h):
+                acc[i] += x
+    return counters, histograms
+
+
+def _collect() -> tuple[dict, dict]:
+    """合并所有 worker 的快照（本进程用实时数据）。"""
+    snapshots = [_snapshot()]
+    if settings.METRICS_DIR:
+        own = f"{os.getpid()}.json"
+        try:
+            _prune_dead()
+        except OSError:
+            logger.exception("metrics: pruning dead snapshots failed")
+        with _dir_lock(exclusive=False) as d:
+            for f in d.glob("*.json"):
+                if f.name == own:
+                    continue
+                snap = _read(f)
+                if snap is not None:
+                    snapshots.append(snap)
+    return _merge(snapshots)
+
+
+# =========================
+# 导出
+# =========================
+def _fmt_labels(labels, extra: tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _db_gauges() -> list[str]:
+    depth = SyncQueue.objects.count()
+    oldest = SyncQueue.objects.order_by("id").values_list("enqueued_at", flat=True).first()
+    lag = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    lines = []
+    for name, value in (("iot_sync_queue_depth", depth), ("iot_sync_queue_lag_seconds", lag)):
+        lines += [f"# HELP {name} {HELP[name]}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return lines
+
+
+def render_text() -> str:
+    counters, histograms = _collect()
+    lines = []
+
+    by_name = defaultdict(list)
+    for (name, lbl), v in counters.items():
+        by_name[name].append((lbl, v))
+    for name in sorted(by_name):
+        lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+        lines += [f"{name}{_fmt_labels(lbl)} {v}" for lbl, v in sorted(by_name[name])]
+
+    by_name = defaultdict(list)
+    for (name, lbl), h in histograms.items():
+        by_name[name].append((lbl, h))
+    for name in sorted(by_name):
+        bounds = HISTOGRAMS[name]
+        lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+        for lbl, h in sorted(by_name[name]):
+            cum = 0
+            for bound, n in zip(bounds, h):
+                cum += n
+                lines.append(f"{name}_bucket{_fmt_labels(lbl, (('le', bound),))} {cum}")
+            cum += h[len(bounds)]
+            lines.append(f"{name}_bucket{_fmt_labels(lbl, (('le', '+Inf'),))} {cum}")
+            lines.append(f"{name}_sum{_fmt_labels(lbl)} {h[-1]}")
+            lines.append(f"{name}_count{_fmt_labels(lbl)} {cum}")
+
+    try:
+        lines += _db_gauges()
+    except Exception:
+        logger.exception("metrics: sync_queue gauges unavailable")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """GET /metrics（Prometheus text format 0.0.4）"""
+    return HttpResponse(render_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# =========================
+# Middleware
+# =========================
+class MetricsMiddleware:
+    """记录每个视图的耗时、SQL 条数与 SQL 耗时。放在 MIDDLEWARE 最前面以覆盖完整请求。"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = [0, 0.0]    # [SQL 条数, SQL 耗时]
+
+        def wrapper(execute, sql, params, many, context):
+            t0 = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats[0] += 1
+                stats[1] += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:     # 含只读副本
+                stack.enter_context(connections[alias].execute_wrapper(wrapper))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - t0
+
+        match = getattr(request, "resolver_match", None)
+        view = match.route if match else "unmatched"
+        observe("iot_http_request_duration_seconds", elapsed, view=view)
+        observe("iot_db_queries_per_request", stats[0], view=view)
+        inc("iot_http_requests_total", view=view, method=request.method,
+            status=f"{response.status_code // 100}xx")
+        if stats[0]:
+            inc("iot_db_query_seconds_total", stats[1], view=view)
+        return response
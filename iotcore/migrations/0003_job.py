@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iotcore', '0002_alter_edgedata_quality'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sync', 'sync_to_cloud'), ('daily_report', 'generate_report')], max_length=32)),
+                ('status', models.CharField(choices=[('queued', 'QUEUED'), ('running', 'RUNNING'), ('succeeded', 'SUCCEEDED'), ('failed', 'FAILED'), ('skipped', 'SKIPPED')], default='queued', max_length=16)),
+                ('params', models.JSONField(blank=True, null=True)),
+                ('progress', models.FloatField(default=0)),
+                ('rows_processed', models.IntegerField(default=0)),
+                ('error', models.CharField(blank=True, max_length=512)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'jobs',
+                'indexes': [models.Index(fields=['kind', 'created_at'], name='jobs_kind_e4b80b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,120 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def drop_alert_trigger(apps, schema_editor):
+    """告警改由 iotcore.alerting 在上报时合并生成，停用逐样本写 alerts 的触发器。"""
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("DROP TRIGGER IF EXISTS trg_edge_alerts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("iotcore", "0003_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alert",
+            name="cleared_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="alert",
+            name="count",
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="alert",
+            name="last_ts",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="alert",
+            name="last_value",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        # 历史告警（触发器逐样本写入的）一律视为已解除；新告警默认 OPEN
+        migrations.AddField(
+            model_name="alert",
+            name="state",
+            field=models.CharField(
+                choices=[("OPEN", "OPEN"), ("CLEARED", "CLEARED")],
+                default="CLEARED",
+                max_length=16,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="alert",
+            name="state",
+            field=models.CharField(
+                choices=[("OPEN", "OPEN"), ("CLEARED", "CLEARED")],
+                default="OPEN",
+                max_length=16,
+            ),
+        ),
+        migrations.AddField(
+            model_name="device",
+            name="alert_hysteresis",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="device",
+            name="alert_min_duration",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="AlertState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("level", models.CharField(max_length=16)),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("CLEARED", "CLEARED"),
+                            ("PENDING", "PENDING"),
+                            ("OPEN", "OPEN"),
+                        ],
+                        default="CLEARED",
+                        max_length=16,
+                    ),
+                ),
+                ("since", models.DateTimeField(blank=True, null=True)),
+                ("samples", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "alert",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="iotcore.alert",
+                    ),
+                ),
+                (
+                    "device",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="iotcore.device"
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "alert_state",
+                "unique_together": {("device", "level")},
+            },
+        ),
+        # 触发器的 DDL 不在本仓库，无法可靠重建：不提供反向操作，回滚本迁移会抛 IrreversibleError
+        migrations.RunPython(drop_alert_trigger),
+    ]
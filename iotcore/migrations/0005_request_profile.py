@@ -0,0 +1,42 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("iotcore", "0004_alert_coalescing"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RequestProfile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("method", models.CharField(max_length=8)),
+                ("path", models.CharField(max_length=512)),
+                ("status", models.IntegerField()),
+                ("trigger", models.CharField(max_length=16)),
+                ("user", models.CharField(blank=True, max_length=150)),
+                ("duration_ms", models.FloatField()),
+                ("sql_count", models.IntegerField(default=0)),
+                ("sql_ms", models.FloatField(default=0)),
+                ("profile", models.TextField(blank=True)),
+                ("sql_timeline", models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                "db_table": "request_profiles",
+                "ordering": ["-id"],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("iotcore", "0005_request_profile"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="alert",
+            index=models.Index(fields=["ts"], name="alerts_ts_5821e2_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="clouddata",
+            index=models.Index(fields=["ts"], name="cloud_data_ts_e6b8ec_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="edgedata",
+            index=models.Index(fields=["ts"], name="edge_data_ts_586231_idx"),
+        ),
+    ]
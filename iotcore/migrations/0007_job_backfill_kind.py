@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("iotcore", "0006_ts_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="job",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("sync", "sync_to_cloud"),
+                    ("daily_report", "generate_report"),
+                    ("backfill", "backfill"),
+                ],
+                max_length=32,
+            ),
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# PROC_sync_to_cloud 不改：同步写入 cloud_data 时由触发器按 (device_id, ts, sensor_value) 找回对应的 edge_data 行，
+# 复制其 channel_values（依赖该过程原样复制 edge_data 的 ts 与 sensor_value；找不到对应行时保持 NULL，按单通道处理）。
+# 历史回灌直接写 cloud_data 时会话里设置 @iot_skip_channel_copy，跳过这次查找。
+CHANNEL_TRIGGER = """
+CREATE TRIGGER trg_cloud_channel_values BEFORE INSERT ON cloud_data
+FOR EACH ROW
+BEGIN
+  IF NEW.channel_values IS NULL AND @iot_skip_channel_copy IS NULL THEN
+    SET NEW.channel_values = (
+      SELECT e.channel_values FROM edge_data e
+      WHERE e.device_id = NEW.device_id AND e.ts = NEW.ts AND e.sensor_value = NEW.sensor_value
+        AND e.channel_values IS NOT NULL
+      ORDER BY e.id DESC LIMIT 1
+    );
+  END IF;
+END
+"""
+
+
+def create_channel_trigger(apps, schema_editor):
+    """同步到 cloud_data 的行带上 edge_data.channel_values。"""
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("DROP TRIGGER IF EXISTS trg_cloud_channel_values")
+        schema_editor.execute(CHANNEL_TRIGGER)
+
+
+def drop_channel_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("DROP TRIGGER IF EXISTS trg_cloud_channel_values")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("iotcore", "0007_job_backfill_kind"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="alertstate",
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name="dailysummary",
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name="alert",
+            name="channel",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="alertstate",
+            name="channel",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="clouddata",
+            name="channel_values",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="dailysummary",
+            name="channel",
+            field=models.PositiveSmallIntegerField(db_default=0, default=0),
+        ),
+        migrations.AddField(
+            model_name="edgedata",
+            name="channel_values",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name="alertstate",
+            unique_together={("device", "level", "channel")},
+        ),
+        migrations.AlterUniqueTogether(
+            name="dailysummary",
+            unique_together={("day", "device_id", "channel")},
+        ),
+        migrations.CreateModel(
+            name="DeviceChannel",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("index", models.PositiveSmallIntegerField()),
+                ("name", models.CharField(max_length=64)),
+                ("unit", models.CharField(blank=True, max_length=16)),
+                ("threshold_hi", models.FloatField(blank=True, null=True)),
+                ("threshold_lo", models.FloatField(blank=True, null=True)),
+                ("alert_hysteresis", models.FloatField(blank=True, null=True)),
+                (
+                    "device",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="channels",
+                        to="iotcore.device",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "device_channels",
+                "ordering": ["device", "index"],
+                "unique_together": {("device", "index"), ("device", "name")},
+            },
+        ),
+        migrations.RunPython(create_channel_trigger, drop_channel_trigger),
+    ]
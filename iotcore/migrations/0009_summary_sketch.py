@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("iotcore", "0008_device_channels"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dailysummary",
+            name="sketch",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
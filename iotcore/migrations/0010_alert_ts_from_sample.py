@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 16:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("iotcore", "0009_summary_sketch"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="alert",
+            name="ts",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 class Device(models.Model):
     device_code  = models.CharField(max_length=64, unique=True)
@@ -11,6 +12,8 @@ class Device(models.Model):
     threshold_lo = models.FloatField(null=True, blank=True)
     calibration_k= models.FloatField(null=True, blank=True)     # y=kx+b
     calibration_b= models.FloatField(null=True, blank=True)
+    alert_hysteresis   = models.FloatField(null=True, blank=True)    # 回差：越限后需回到 阈值∓回差 才解除；空=settings.ALERT_HYSTERESIS
+    alert_min_duration = models.IntegerField(null=True, blank=True)  # 秒：持续越限多久才开告警；空=settings.ALERT_MIN_DURATION
     fw_version   = models.CharField(max_length=32, blank=True)
     sampling_hz  = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
     last_seen    = models.DateTimeField(null=True, blank=True)
@@ -19,6 +22,21 @@ class Device(models.Model):
 
     class Meta: db_table = "devices"
 
+class DeviceChannel(models.Model):
+    """设备的附加通道（index >= 1）；通道 0 即设备主量（Device.sensor_type / unit / threshold_*），无需登记"""
+    device       = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="channels")
+    index        = models.PositiveSmallIntegerField()              # 在 channel_values 中的位置：1..N
+    name         = models.CharField(max_length=64)                 # humidity / voltage ...
+    unit         = models.CharField(max_length=16, blank=True)
+    threshold_hi = models.FloatField(null=True, blank=True)
+    threshold_lo = models.FloatField(null=True, blank=True)
+    alert_hysteresis = models.FloatField(null=True, blank=True)    # 空=沿用设备 / settings.ALERT_HYSTERESIS
+
+    class Meta:
+        db_table = "device_channels"
+        unique_together = (("device","index"), ("device","name"))
+        ordering = ["device","index"]
+
 class EdgeData(models.Model):
     device       = models.ForeignKey(Device, on_delete=models.CASCADE)
     sensor_value = models.FloatField()                 # 校准后（可直接等于 raw）
@@ -27,21 +45,48 @@ class EdgeData(models.Model):
     source_ts    = models.DateTimeField(null=True, blank=True)  # 设备自带时间
     quality      = models.IntegerField(default=1, choices=[(1,"GOOD"), (0,"BAD")])
     meta         = models.JSONField(null=True, blank=True)
+    channel_values = models.BinaryField(null=True, blank=True)  # 通道 1..N，float64 小端打包，见 channels.py
 
     class Meta:
         db_table = "edge_data"
-        indexes = [models.Index(fields=["device","ts"])]
+        indexes = [models.Index(fields=["device","ts"]), models.Index(fields=["ts"])]
 
 class Alert(models.Model):
-    device    = models.ForeignKey(Device, on_delete=models.CASCADE)
-    edge_data = models.ForeignKey(EdgeData, on_delete=models.CASCADE)
-    level     = models.CharField(max_length=16)  # HIGH/LOW
-    message   = models.CharField(max_length=512, blank=True)
-    ts        = models.DateTimeField(auto_now_add=True)
+    """一次越限事件：开启时写入一行，持续越限只累加 count / 更新 last_*，回到回差带外后置为 CLEARED"""
+    STATE_CHOICES = [("OPEN", "OPEN"), ("CLEARED", "CLEARED")]
+
+    device     = models.ForeignKey(Device, on_delete=models.CASCADE)
+    edge_data  = models.ForeignKey(EdgeData, on_delete=models.CASCADE)   # 触发告警的首个样本
+    level      = models.CharField(max_length=16)  # HIGH/LOW
+    channel    = models.PositiveSmallIntegerField(default=0)   # 0=主量，其余见 DeviceChannel.index
+    message    = models.CharField(max_length=512, blank=True)
+    ts         = models.DateTimeField(default=timezone.now)   # 开启时刻：取触发样本的 edge_data.ts（回灌重放时为历史时间）
+    state      = models.CharField(max_length=16, choices=STATE_CHOICES, default="OPEN")
+    count      = models.IntegerField(default=1)                 # 本次事件内越限样本数
+    last_value = models.FloatField(null=True, blank=True)
+    last_ts    = models.DateTimeField(null=True, blank=True)
+    cleared_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = "alerts"
-        indexes = [models.Index(fields=["device","ts"])]
+        indexes = [models.Index(fields=["device","ts"]), models.Index(fields=["ts"])]
+
+class AlertState(models.Model):
+    """每台设备每个方向（HIGH/LOW）的告警状态机：CLEARED → PENDING（去抖中）→ OPEN → CLEARED"""
+    STATE_CHOICES = [("CLEARED", "CLEARED"), ("PENDING", "PENDING"), ("OPEN", "OPEN")]
+
+    device     = models.ForeignKey(Device, on_delete=models.CASCADE)
+    level      = models.CharField(max_length=16)  # HIGH/LOW
+    channel    = models.PositiveSmallIntegerField(default=0)
+    state      = models.CharField(max_length=16, choices=STATE_CHOICES, default="CLEARED")
+    since      = models.DateTimeField(null=True, blank=True)    # 本轮越限开始时刻
+    samples    = models.IntegerField(default=0)                 # 本轮连续越限样本数
+    alert      = models.ForeignKey(Alert, null=True, blank=True, on_delete=models.SET_NULL)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "alert_state"
+        unique_together = ("device","level","channel")
 
 class SyncQueue(models.Model):
     edge_data   = models.OneToOneField(EdgeData, on_delete=models.CASCADE)
@@ -52,26 +97,29 @@ class SyncQueue(models.Model):
 class CloudData(models.Model):
     device_id   = models.IntegerField()
     sensor_value= models.FloatField()
+    channel_values = models.BinaryField(null=True, blank=True)  # 同步写入时由触发器 trg_cloud_channel_values 从 edge_data 复制
     ts          = models.DateTimeField()
     synced_at   = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = "cloud_data"
-        indexes = [models.Index(fields=["device_id","ts"])]
+        indexes = [models.Index(fields=["device_id","ts"]), models.Index(fields=["ts"])]
 
 class DailySummary(models.Model):
     day           = models.DateField()
     device_id     = models.IntegerField()
+    channel       = models.PositiveSmallIntegerField(default=0, db_default=0)  # PROC_generate_report 只写通道 0
     count_records = models.IntegerField()
     avg_value     = models.FloatField(null=True)
     max_value     = models.FloatField(null=True)
     min_value     = models.FloatField(null=True)
     alert_count   = models.IntegerField(default=0)
+    sketch        = models.BinaryField(null=True, blank=True)   # 当天数据的 DDSketch（可合并求分位数），见 sketches.py
     generated_at  = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = "daily_summary"
-        unique_together = ("day","device_id")
+        unique_together = ("day","device_id","channel")
 
 class DeviceCredentials(models.Model):
     device     = models.ForeignKey(Device, on_delete=models.CASCADE)
@@ -80,3 +128,50 @@ class DeviceCredentials(models.Model):
     rotated_at = models.DateTimeField(auto_now_add=True)
 
     class Meta: db_table = "device_credentials"
+
+class Job(models.Model):
+    """后台任务（同步/日报）：POST 立即返回 id，由 worker 池执行，GET /api/jobs/<id>/ 查看进度"""
+    KIND_CHOICES = [("sync", "sync_to_cloud"), ("daily_report", "generate_report"),
+                    ("backfill", "backfill")]   # backfill 由 manage.py backfill 创建，params 中保存断点
+    STATUS_CHOICES = [("queued", "QUEUED"), ("running", "RUNNING"), ("succeeded", "SUCCEEDED"),
+                      ("failed", "FAILED"), ("skipped", "SKIPPED")]
+
+    kind           = models.CharField(max_length=32, choices=KIND_CHOICES)
+    status         = models.CharField(max_length=16, choices=STATUS_CHOICES, default="queued")
+    params         = models.JSONField(null=True, blank=True)
+    progress       = models.FloatField(default=0)       # 0 ~ 1
+    rows_processed = models.IntegerField(default=0)
+    error          = models.CharField(max_length=512, blank=True)
+    created_at     = models.DateTimeField(auto_now_add=True)
+    started_at     = models.DateTimeField(null=True, blank=True)
+    finished_at    = models.DateTimeField(null=True, blank=True)
+    heartbeat_at   = models.DateTimeField(null=True, blank=True)   # 运行中定期刷新，超时视为 worker 已退出
+
+    class Meta:
+        db_table = "jobs"
+        indexes = [models.Index(fields=["kind","created_at"])]
+
+    @property
+    def duration(self):
+        """执行耗时（秒）；运行中按当前时刻计算"""
+        if not self.started_at:
+            return None
+        return ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+
+class RequestProfile(models.Model):
+    """按需采集的请求剖析（cProfile + SQL 时间线），只保留最近 settings.PROFILING_KEEP 条"""
+    created_at   = models.DateTimeField(auto_now_add=True)
+    method       = models.CharField(max_length=8)
+    path         = models.CharField(max_length=512)
+    status       = models.IntegerField()
+    trigger      = models.CharField(max_length=16)       # sample / header
+    user         = models.CharField(max_length=150, blank=True)
+    duration_ms  = models.FloatField()
+    sql_count    = models.IntegerField(default=0)
+    sql_ms       = models.FloatField(default=0)
+    profile      = models.TextField(blank=True)          # pstats 文本（按累计耗时排序）
+    sql_timeline = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        db_table = "request_profiles"
+        ordering = ["-id"]
@@ -0,0 +1,112 @@
+# iotcore/profiling.py
+"""
+按需请求剖析：
+- settings.PROFILING_ENABLED 为 False 时中间件直接 MiddlewareNotUsed，不进入请求链路（零开销）；
+- 开启后，按 PROFILING_SAMPLE_RATE 抽样，或请求带签名头 X-Iot-Profile（manage.py profile_token <staff 用户> 生成）时剖析；
+- 记录 cProfile 统计（按累计耗时排序的前 PROFILING_TOP_FUNCTIONS 个函数）与该请求的 SQL 时间线，
+  写入 request_profiles 表，只保留最近 PROFILING_KEEP 条，在 admin 中查看。
+"""
+from __future__ import annotations
+
+import cProfile
+import io
+import pstats
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import RequestProfile
+
+TOKEN_SALT = "iotcore.profiling"
+MAX_TIMELINE = 1000
+
+
+def make_token(username: str) -> str:
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(username)
+
+
+def _token_user(token: str) -> str | None:
+    """校验签名头，返回有效的 staff 用户名。"""
+    try:
+        username = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if not get_user_model().objects.filter(username=username, is_staff=True, is_active=True).exists():
+        return None
+    return username
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.headers.get("X-Iot-Profile")
+        user = _token_user(token) if token else None
+        if user:
+            trigger = "header"
+        elif settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+            trigger = "sample"
+        else:
+            return self.get_response(request)
+        return self._profile(request, trigger, user or "")
+
+    def _profile(self, request, trigger: str, user: str):
+        timeline = []
+        t_start = time.perf_counter()
+
+        def wrapper(execute, sql, params, many, context):
+            t0 = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                if len(timeline) < MAX_TIMELINE:
+                    timeline.append({
+                        "start_ms": round((t0 - t_start) * 1000, 3),
+                        "duration_ms": round((time.perf_counter() - t0) * 1000, 3),
+                        "alias": context["connection"].alias,
+                        "sql": sql[:2000],
+                        "many": many,
+                    })
+
+        prof = cProfile.Profile()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(wrapper))
+            prof.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                prof.disable()
+        duration_ms = (time.perf_counter() - t_start) * 1000
+
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(settings.PROFILING_TOP_FUNCTIONS)
+
+        record = RequestProfile.objects.using(DEFAULT_DB_ALIAS).create(
+            method=request.method, path=request.get_full_path()[:512], status=response.status_code,
+            trigger=trigger, user=user, duration_ms=round(duration_ms, 3),
+            sql_count=len(timeline), sql_ms=round(sum(q["duration_ms"] for q in timeline), 3),
+            profile=out.getvalue(), sql_timeline=timeline,
+        )
+        _trim_ring()
+        response["X-Iot-Profile-Id"] = str(record.id)
+        return response
+
+
+def _trim_ring():
+    """只保留最近 PROFILING_KEEP 条。"""
+    cutoff = (RequestProfile.objects.using(DEFAULT_DB_ALIAS).order_by("-id")
+              .values_list("id", flat=True)[settings.PROFILING_KEEP:settings.PROFILING_KEEP + 1])
+    cutoff = list(cutoff)
+    if cutoff:
+        RequestProfile.objects.using(DEFAULT_DB_ALIAS).filter(id__lte=cutoff[0]).delete()
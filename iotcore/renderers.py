@@ -0,0 +1,151 @@
+# iotcore/renderers.py
+from __future__ import annotations
+
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .series import pack_array, pack_header, pack_series, render_series, to_epoch_ms, to_local_iso
+
+try:
+    import orjson   # 可选依赖：没有安装时回退到 DRF 自带的 json 编码
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import pyarrow   # 可选依赖：Arrow IPC 输出
+    import pyarrow.ipc
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    大数组响应（时间序列）用 orjson 编码，比标准库 json 快一个数量级。
+    需要缩进（Browsable API / ?indent）或遇到 orjson 不支持的类型时，走 DRF 原实现。
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type or "", renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+    def render_stream(self, series, *, layout: str, ts_format: str):
+        """
+        分块输出序列（series 为 series.ChunkedSeries），每块单独编码后拼接成一个 JSON 文档。
+        rows 一次遍历；columns 先遍历一次输出 ts 列，再遍历一次输出 value 列。
+        """
+        if layout == "rows":
+            yield b"["
+            sep = b""
+            for ts, values in series:
+                yield sep + _dumps(render_series(ts, values, layout="rows", ts_format=ts_format))[1:-1]
+                sep = b","
+            yield b"]"
+            return
+        format_ts = to_epoch_ms if ts_format == "epoch_ms" else to_local_iso
+        yield b'{"ts":['
+        sep = b""
+        for ts, _ in series:
+            yield sep + _dumps(format_ts(ts))[1:-1]
+            sep = b","
+        yield b'],"value":['
+        sep = b""
+        for _, values in series:
+            yield sep + _dumps(values)[1:-1]
+            sep = b","
+        yield b"]}"
+
+
+def _dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+class _SeriesRenderer(BaseRenderer):
+    """
+    二进制序列渲染器基类：data 须为列式 {"ts": [epoch_ms...], "value": [...]}。
+    错误响应（4xx/5xx）等非序列数据按 JSON 输出，避免客户端把错误当成二进制解析。
+    """
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get("response")
+        if not (isinstance(data, dict) and "ts" in data and "value" in data) or (
+                response is not None and response.status_code >= 400):
+            if response is not None:
+                response["Content-Type"] = "application/json"
+            return FastJSONRenderer().render(data, renderer_context=renderer_context)
+        return self.render_series(data["ts"], data["value"])
+
+    def render_series(self, ts_ms, values) -> bytes:
+        raise NotImplementedError
+
+
+class SeriesBinaryRenderer(_SeriesRenderer):
+    """application/octet-stream：16 字节头 + int64 毫秒时间戳数组 + float64 数值数组（小端），见 series.pack_series。"""
+    media_type = "application/octet-stream"
+    format = "bin"
+
+    def render_series(self, ts_ms, values) -> bytes:
+        return pack_series(ts_ms, values)
+
+    def render_stream(self, series, **kwargs):
+        """
+        头部点数取自 series.count()，随后两次遍历分别输出时间戳数组和数值数组（需在 series.stream() 的快照内）。
+        任一段点数与头部不符时中断输出，客户端收到的是不完整的响应而不是错位的数据。
+        """
+        n = series.count()
+        yield pack_header(n)
+        for typecode, column in (("q", 0), ("d", 1)):
+            emitted = 0
+            for chunk in series:
+                items = to_epoch_ms(chunk[0]) if column == 0 else chunk[1]
+                emitted += len(items)
+                yield pack_array(typecode, items)
+            if emitted != n:
+                raise RuntimeError(f"series changed during export: header has {n} points, got {emitted}")
+
+
+class ArrowStreamRenderer(_SeriesRenderer):
+    """Arrow IPC stream：ts 为 timestamp[ms, UTC]，value 为 float64。需要安装 pyarrow。"""
+    media_type = "application/vnd.apache.arrow.stream"
+    format = "arrow"
+
+    def render_series(self, ts_ms, values) -> bytes:
+        table = self._table(ts_ms, values)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def render_stream(self, series, **kwargs):
+        """每块一个 record batch，一次遍历：先输出 schema，再逐块输出 batch，最后是流结束标记。"""
+        schema = self._table([], []).schema
+        yield schema.serialize().to_pybytes()
+        for ts, values in series:
+            for batch in self._table(to_epoch_ms(ts), values).to_batches():
+                yield batch.serialize().to_pybytes()
+        yield _ARROW_EOS
+
+    @staticmethod
+    def _table(ts_ms, values):
+        return pyarrow.table({
+            "ts": pyarrow.array(ts_ms, type=pyarrow.timestamp("ms", tz="UTC")),
+            "value": pyarrow.array(values, type=pyarrow.float64()),
+        })
+
+
+_ARROW_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"   # IPC 流结束标记（continuation + 长度 0）
+
+
+# 时间序列接口可协商的渲染器（Accept 头或 ?format=json|bin|arrow）
+SERIES_RENDERERS = [FastJSONRenderer, SeriesBinaryRenderer]
+if pyarrow is not None:
+    SERIES_RENDERERS.append(ArrowStreamRenderer)
+BINARY_FORMATS = ("bin", "arrow")
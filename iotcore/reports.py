@@ -0,0 +1,124 @@
+# iotcore/reports.py
+"""
+日报重算（Python 实现，与 PROC_generate_report 口径一致）：
+- 按本地日期（settings.TIME_ZONE）逐天聚合 cloud_data：条数 / 均值 / 最大 / 最小；
+- 逐行读取 (device_id, sensor_value, channel_values)，按 (设备, 通道) 累加进 DDSketch，
+  条数 / 均值 / 最大 / 最小取自草图的精确统计，sketch 列写入序列化草图（见 sketches.py）；
+- alert_count 按触发样本（edge_data.ts）所在日期、按通道统计，历史回灌重放出的告警也落在正确的那一天；
+- 结果按 (day, device_id, channel) upsert，可重复执行（MySQL 为 ON DUPLICATE KEY UPDATE，不能指定冲突列）。
+用于历史回灌（manage.py backfill --rebuild-summary）等一次要补很多天的场景；
+日报任务在 PROC_generate_report（只写通道 0）之后用它补齐附加通道，并补算缺失或与条数不符的通道 0 草图。
+"""
+from __future__ import annotations
+
+import datetime
+
+from django.db import connections, router
+from django.db.models import Count
+from django.utils import timezone
+
+from .channels import unpack_channels
+from .models import Alert, CloudData, DailySummary
+from .sketches import DDSketch
+
+UNIQUE_FIELDS = ["day", "device_id", "channel"]
+UPDATE_FIELDS = ["count_records", "avg_value", "max_value", "min_value", "alert_count", "sketch", "generated_at"]
+
+
+def day_bounds(day: datetime.date) -> tuple[datetime.datetime, datetime.datetime]:
+    """本地日期 day 的 [00:00, 次日 00:00) aware 区间。"""
+    tz = timezone.get_current_timezone()
+    lo = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min), tz)
+    hi = timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min), tz)
+    return lo, hi
+
+
+def rebuild_daily_summary(start: datetime.date, end: datetime.date, device_ids=None, *,
+                          primary: bool = True) -> int:
+    """
+    重算 [start, end] 每天的日报（device_ids 为空表示全部设备），返回写入行数。
+    primary=False 时只重算附加通道（通道 0 已由存储过程生成）。
+    """
+    written = 0
+    day = start
+    while day <= end:
+        lo, hi = day_bounds(day)
+        data = CloudData.objects.filter(ts__gte=lo, ts__lt=hi)
+        alerts = Alert.objects.filter(edge_data__ts__gte=lo, edge_data__ts__lt=hi)
+        if device_ids is not None:
+            data = data.filter(device_id__in=device_ids)
+            alerts = alerts.filter(device_id__in=device_ids)
+
+        alert_counts = {(d, c): n for d, c, n in
+                        alerts.values("device_id", "channel").annotate(n=Count("id"))
+                        .values_list("device_id", "channel", "n")}
+        rows = [
+            DailySummary(day=day, device_id=device_id, channel=channel, count_records=sk.count,
+                         avg_value=sk.avg, max_value=sk.max, min_value=sk.min,
+                         alert_count=alert_counts.get((device_id, channel), 0), sketch=sk.to_bytes())
+            for (device_id, channel), sk in sorted(_sketch_rows(data, primary).items())
+        ]
+        if rows:
+            upsert_summaries(rows)
+        written += len(rows)
+        day += datetime.timedelta(days=1)
+    return written
+
+
+def upsert_summaries(rows: list[DailySummary]):
+    """
+    按 (day, device_id, channel) upsert。MySQL 的 ON DUPLICATE KEY UPDATE 不支持指定冲突列
+    （传 unique_fields 会抛 NotSupportedError），按表上的唯一键判断冲突，daily_summary 只有这一个唯一键。
+    """
+    features = connections[router.db_for_write(DailySummary)].features
+    conflict = {"unique_fields": UNIQUE_FIELDS} if features.supports_update_conflicts_with_target else {}
+    DailySummary.objects.bulk_create(rows, batch_size=1000, update_conflicts=True,
+                                     update_fields=UPDATE_FIELDS, **conflict)
+
+
+def _sketch_rows(data, primary: bool) -> dict[tuple[int, int], DDSketch]:
+    """(device_id, channel) -> 当天数据的草图；primary=False 时只统计带 channel_values 的行的附加通道。"""
+    acc: dict[tuple[int, int], DDSketch] = {}
+
+    def add(key, v):
+        sk = acc.get(key)
+        if sk is None:
+            sk = acc[key] = DDSketch()
+        sk.add(v)
+
+    if not primary:
+        data = data.filter(channel_values__isnull=False)
+    for device_id, value, blob in data.values_list("device_id", "sensor_value", "channel_values").iterator(
+            chunk_size=5000):
+        if primary:
+            add((device_id, 0), value)
+        for index, v in enumerate(unpack_channels(blob), start=1):
+            if v is not None:
+                add((device_id, index), v)
+    return acc
+
+
+def fill_missing_sketches(day: datetime.date) -> int:
+    """
+    为当天通道 0 日报行补算草图，其余列不动，返回补算行数。需要补算的行：
+    - sketch 为空（如存储过程新建的行）；
+    - 草图条数与 count_records 不符：上报缓冲在进程被强杀或合并失败时丢了样本，存储过程重写的统计列是全量的。
+    附加通道由 rebuild_daily_summary(primary=False) 整行重算，不在此处理。
+    """
+    rows = [r for r in DailySummary.objects.filter(day=day, channel=0)
+            if not r.sketch or DDSketch.from_bytes(r.sketch).count != r.count_records]
+    if not rows:
+        return 0
+    lo, hi = day_bounds(day)
+    sketches = {}
+    data = CloudData.objects.filter(ts__gte=lo, ts__lt=hi, device_id__in=[r.device_id for r in rows])
+    for device_id, value in data.values_list("device_id", "sensor_value").iterator(chunk_size=5000):
+        sk = sketches.get(device_id)
+        if sk is None:
+            sk = sketches[device_id] = DDSketch()
+        sk.add(value)
+    rows = [r for r in rows if r.device_id in sketches]
+    for r in rows:
+        r.sketch = sketches[r.device_id].to_bytes()
+    DailySummary.objects.bulk_update(rows, ["sketch"], batch_size=500)
+    return len(rows)
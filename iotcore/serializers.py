@@ -1,15 +1,34 @@
 from rest_framework import serializers
-from .models import Device, Alert, DailySummary
+from .models import Device, DeviceChannel, Alert, DailySummary, Job
+from .sketches import DDSketch
+
+class DeviceChannelSerializer(serializers.ModelSerializer):
+    class Meta: model = DeviceChannel; exclude = ("id","device")
 
 class DeviceSerializer(serializers.ModelSerializer):
+    channels = DeviceChannelSerializer(many=True, read_only=True)
     class Meta: model = Device; fields = "__all__"
 
 class AlertSerializer(serializers.ModelSerializer):
     class Meta: model = Alert; fields = "__all__"
 
 class DailySummarySerializer(serializers.ModelSerializer):
-    class Meta: model = DailySummary; fields = "__all__"
-from rest_framework import serializers
+    p50 = serializers.SerializerMethodField()
+    p95 = serializers.SerializerMethodField()
+    p99 = serializers.SerializerMethodField()
+    class Meta: model = DailySummary; exclude = ("sketch",)
+
+    def to_representation(self, obj):
+        # 每行只解码一次草图，p50/p95/p99 共用
+        self._sketch = DDSketch.from_bytes(obj.sketch) if obj.sketch else None
+        return super().to_representation(obj)
+
+    def _quantile(self, q):
+        return self._sketch.quantile(q) if self._sketch is not None else None
+
+    def get_p50(self, obj) -> float | None: return self._quantile(0.5)
+    def get_p95(self, obj) -> float | None: return self._quantile(0.95)
+    def get_p99(self, obj) -> float | None: return self._quantile(0.99)
 
 class CloudPointSerializer(serializers.Serializer):
     ts = serializers.CharField()
@@ -21,3 +40,10 @@ class DailySeriesSerializer(serializers.Serializer):
     max_value = serializers.FloatField(allow_null=True)
     min_value = serializers.FloatField(allow_null=True)
     alert_count = serializers.IntegerField()
+    p50 = serializers.FloatField(allow_null=True)
+    p95 = serializers.FloatField(allow_null=True)
+    p99 = serializers.FloatField(allow_null=True)
+
+class JobSerializer(serializers.ModelSerializer):
+    duration = serializers.FloatField(read_only=True, allow_null=True)
+    class Meta: model = Job; fields = "__all__"
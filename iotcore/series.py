@@ -0,0 +1,206 @@
+# iotcore/series.py
+"""
+时间序列快速序列化：
+- 用 values_list 取 (ts, value) 元组，不构造模型实例；
+- 时区偏移只算一次（整段序列内没有时区切换时），整列做加法 + isoformat，代替逐行 localtime + strftime；
+- 输出列式 {"ts": [...], "value": [...]} 或兼容旧版的行式 [{"ts":..., "value":...}, ...]；
+- 大范围导出用 ChunkedSeries 分块读取，配合渲染器的 render_stream 边读边发。
+"""
+from __future__ import annotations
+
+import datetime
+import struct
+import sys
+from array import array
+from contextlib import contextmanager
+from typing import Optional
+
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .channels import channel_value
+
+LAYOUTS = ("rows", "columns")
+TS_FORMATS = ("iso", "epoch_ms")
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MS = datetime.timedelta(milliseconds=1)
+_PROBE_STEP = datetime.timedelta(days=1)
+
+
+def fetch_columns(qs, value_field: str = "sensor_value", channel: int = 0) -> tuple[list, list]:
+    """执行查询，返回 (ts 列, value 列)。channel >= 1 时从 channel_values 解包该通道，缺测的点跳过。"""
+    if channel:
+        ts, values = [], []
+        for t, blob in qs.values_list("ts", "channel_values"):
+            v = channel_value(blob, channel)
+            if v is not None:
+                ts.append(t)
+                values.append(v)
+        return ts, values
+
+    rows = list(qs.values_list("ts", value_field))
+    if not rows:
+        return [], []
+    ts, values = zip(*rows)
+    return list(ts), [float(v) for v in values]
+
+
+def _fixed_offset(ts: list) -> Optional[datetime.timedelta]:
+    """
+    整段序列的本地时区偏移一致时返回该偏移，否则返回 None。
+    只比较首尾会漏掉区间内来回两次切换（如跨过整个夏令时）的情况，因此在 [首, 尾] 内按天探测偏移：
+    时区两次切换的间隔远大于一天，探测点偏移全部相同即整段无切换。
+    """
+    tz = timezone.get_current_timezone()
+    lo, hi = min(ts[0], ts[-1]), max(ts[0], ts[-1])
+    first = lo.astimezone(tz).utcoffset()
+    if hi.astimezone(tz).utcoffset() != first:
+        return None
+    t = lo + _PROBE_STEP
+    while t < hi:
+        if t.astimezone(tz).utcoffset() != first:
+            return None
+        t += _PROBE_STEP
+    return first
+
+
+def to_local_iso(ts: list) -> list[str]:
+    """
+    批量转换为本地时区、无时区后缀、精确到秒的字符串（YYYY-MM-DDTHH:MM:SS），避免前端再偏移时区。
+    """
+    if not ts:
+        return []
+    if timezone.is_naive(ts[0]):
+        return [t.isoformat(timespec="seconds") for t in ts]
+
+    off = _fixed_offset(ts)
+    if off is None:
+        tz = timezone.get_current_timezone()
+        return [t.astimezone(tz).replace(tzinfo=None).isoformat(timespec="seconds") for t in ts]
+    # 同一查询返回的时间 tzinfo 一致（通常是 UTC），偏移差只算一次
+    delta = off - ts[0].utcoffset()
+    return [(t.replace(tzinfo=None) + delta).isoformat(timespec="seconds") for t in ts]
+
+
+def to_epoch_ms(ts: list) -> list[int]:
+    """UTC 毫秒时间戳；naive 时间按当前时区解释。"""
+    if not ts:
+        return []
+    if timezone.is_naive(ts[0]):
+        tz = timezone.get_current_timezone()
+        return [(timezone.make_aware(t, tz) - _EPOCH) // _MS for t in ts]
+    return [(t - _EPOCH) // _MS for t in ts]
+
+
+def render_series(ts: list, values: list, *, layout: str = "rows", ts_format: str = "iso"):
+    """按 layout / ts_format 组装响应体。"""
+    ts_out = to_epoch_ms(ts) if ts_format == "epoch_ms" else to_local_iso(ts)
+    if layout == "columns":
+        return {"ts": ts_out, "value": values}
+    return [{"ts": t, "value": v} for t, v in zip(ts_out, values)]
+
+
+# =========================
+# 二进制打包（application/octet-stream）
+# =========================
+# 头部 16 字节，小端：magic "IOTS" | u8 版本 | u8 flags | u16 保留 | u64 点数 n
+# 随后 int64[n] UTC 毫秒时间戳，再 float64[n] 数值；两段数组都 8 字节对齐，
+# 浏览器可直接 new BigInt64Array(buf, 16, n) / new Float64Array(buf, 16 + 8 * n, n)，
+# 分析端可 numpy.memmap 下载的文件。
+BINARY_MAGIC = b"IOTS"
+BINARY_VERSION = 1
+_HEADER = struct.Struct("<4sBBHQ")
+
+
+def pack_header(n: int) -> bytes:
+    return _HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, 0, n)
+
+
+def pack_array(typecode: str, items: list) -> bytes:
+    """int64（"q"）/ float64（"d"）小端数组。"""
+    arr = array(typecode, items)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def pack_series(ts_ms: list[int], values: list[float]) -> bytes:
+    return b"".join((pack_header(len(ts_ms)), pack_array("q", ts_ms), pack_array("d", values)))
+
+
+# =========================
+# 分块读取（大范围导出）
+# =========================
+class ChunkedSeries:
+    """
+    按 (ts, id) 键集分页读取 qs，逐块产出 (ts 列, value 列)，内存只与 chunk_size 有关；limit 为最多读取的行数。
+    可重复遍历（列式格式先输出整列 ts、再输出整列 value）。多次遍历必须放在 stream() 里：
+    它在一个可重复读事务中执行，各次遍历看到同一份快照，期间的追加、保留期删除都不会让 ts 与 value 错位。
+    """
+
+    def __init__(self, qs, *, channel: int = 0, limit: Optional[int] = None, chunk_size: int = 50_000):
+        manager = qs.model._default_manager.using(qs.db)
+        max_id = manager.order_by("-id").values_list("id", flat=True).first() or 0
+        self.qs = qs.using(qs.db).filter(id__lte=max_id).order_by("ts", "id")
+        self.channel = channel
+        self.limit = limit
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        field = "channel_values" if self.channel else "sensor_value"
+        remaining = self.limit
+        last = None
+        while remaining is None or remaining > 0:
+            page = self.qs
+            if last is not None:
+                page = page.filter(Q(ts__gt=last[0]) | Q(ts=last[0], id__gt=last[1]))
+            n = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            rows = list(page.values_list("ts", "id", field)[:n])
+            if not rows:
+                return
+            last = rows[-1][:2]
+            if remaining is not None:
+                remaining -= len(rows)
+            if self.channel:
+                pairs = [(t, channel_value(blob, self.channel)) for t, _, blob in rows]
+                pairs = [(t, v) for t, v in pairs if v is not None]
+            else:
+                pairs = [(t, float(v)) for t, _, v in rows]
+            if pairs:
+                ts, values = zip(*pairs)
+                yield list(ts), list(values)
+            if len(rows) < n:
+                return
+
+    def stream(self, chunks):
+        """在一致快照里产出 chunks（渲染器 render_stream 的输出）。事务随响应结束或客户端断开而结束。"""
+        with consistent_snapshot(self.qs.db):
+            yield from chunks
+
+    def truncated(self) -> bool:
+        """范围内的行数是否超过 limit（导出被截断）。"""
+        return self.limit is not None and self.qs[self.limit:self.limit + 1].exists()
+
+    def count(self) -> int:
+        """点数（二进制格式头部需要）；附加通道缺测的点不计入，需要读一遍数据。"""
+        if self.channel:
+            return sum(len(ts) for ts, _ in self)
+        qs = self.qs if self.limit is None else self.qs[:self.limit]
+        return qs.count()
+
+
+@contextmanager
+def consistent_snapshot(using: str):
+    """
+    只读的可重复读事务：MySQL 默认 READ COMMITTED 下每条语句各自取快照，这里改为整个事务共用一个。
+    已在事务中时沿用外层事务（不能再改隔离级别）；SQLite 的事务本身就是串行化的。
+    """
+    conn = connections[using]
+    outer = conn.in_atomic_block
+    with transaction.atomic(using=using):
+        if not outer and conn.vendor in ("mysql", "postgresql"):
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        yield
@@ -0,0 +1,294 @@
+# iotcore/sketches.py
+"""
+可合并的分位数草图（DDSketch）：
+- 按 log_gamma(|x|) 分桶计数，任意分位数的相对误差不超过 settings.SKETCH_RELATIVE_ACCURACY（默认 1%）；
+- 两个草图相加即为合并后数据的草图：日报行各存一份，任意日期范围 / 设备集合的 p50/p95/p99 只需合并这些行；
+- 桶数超过 settings.SKETCH_MAX_BINS 时合并最靠近 0 的桶，保证尾部（p95/p99）精度；
+- 同时精确记录 count / sum / min / max，序列化为紧凑二进制（varint 编码的桶号差值 + 计数）存进 daily_summary.sketch。
+
+上报路径只在进程内缓冲（record_sample），后台线程每 SKETCH_FLUSH_INTERVAL 秒把缓冲合并进对应的日报行，
+多个 worker 各自合并，顺序无关；正常退出时（atexit）再合并一次。进程被强杀或合并失败最多丢失一个周期的样本，
+次日日报任务的 reports.fill_missing_sketches 发现草图条数与 count_records 不符时按全量数据重算通道 0 的草图。
+"""
+from __future__ import annotations
+
+import atexit
+import datetime
+import logging
+import math
+import struct
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import DailySummary
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"IOTQ"
+VERSION = 1
+_HEADER = struct.Struct("<4sBdQdddQ")   # magic | 版本 | alpha | count | sum | min | max | 零值计数
+_MIN_INDEXABLE = 1e-9                   # |x| 小于该值记为 0
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy: float | None = None, max_bins: int | None = None):
+        self.alpha = relative_accuracy or settings.SKETCH_RELATIVE_ACCURACY
+        self.max_bins = max_bins or settings.SKETCH_MAX_BINS
+        self.gamma = (1 + self.alpha) / (1 - self.alpha)
+        self._mult = 1 / math.log(self.gamma)
+        self.pos: dict[int, int] = defaultdict(int)
+        self.neg: dict[int, int] = defaultdict(int)
+        self.zero = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    # =========================
+    # 写入 / 合并
+    # =========================
+    def _key(self, x: float) -> int:
+        return math.ceil(math.log(x) * self._mult)
+
+    def add(self, x: float, n: int = 1):
+        if not math.isfinite(x):
+            raise ValueError(f"cannot add non-finite value {x} to a sketch")
+        if x > _MIN_INDEXABLE:
+            self.pos[self._key(x)] += n
+        elif x < -_MIN_INDEXABLE:
+            self.neg[self._key(-x)] += n
+        else:
+            self.zero += n
+        self.count += n
+        self.sum += x * n
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        if len(self.pos) + len(self.neg) > self.max_bins:
+            self._collapse()
+
+    def merge(self, other: "DDSketch") -> "DDSketch":
+        if not math.isclose(self.alpha, other.alpha):
+            raise ValueError(f"cannot merge sketches with relative accuracy {self.alpha} and {other.alpha}")
+        for k, n in other.pos.items():
+            self.pos[k] += n
+        for k, n in other.neg.items():
+            self.neg[k] += n
+        self.zero += other.zero
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self.pos) + len(self.neg) > self.max_bins:
+            self._collapse()
+        return self
+
+    def _collapse(self):
+        """把最靠近 0 的桶并入相邻桶，直到桶数不超过上限（先负值侧靠近 0 的桶，再正值侧最低的桶）。"""
+        excess = len(self.pos) + len(self.neg) - self.max_bins
+        for store in (self.neg, self.pos):
+            if excess <= 0 or len(store) < 2:
+                continue
+            keys = sorted(store)
+            n = min(excess, len(keys) - 1)
+            moved = sum(store.pop(k) for k in keys[:n])
+            store[keys[n]] += moved
+            excess -= n
+
+    # =========================
+    # 查询
+    # =========================
+    def _value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = 0
+        for k in sorted(self.neg, reverse=True):
+            seen += self.neg[k]
+            if seen > rank:
+                return self._clamp(-self._value(k))
+        seen += self.zero
+        if seen > rank:
+            return self._clamp(0.0)
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return self._clamp(self._value(k))
+        return self.max
+
+    def _clamp(self, v: float) -> float:
+        return min(max(v, self.min), self.max)
+
+    @property
+    def avg(self) -> float | None:
+        return self.sum / self.count if self.count else None
+
+    # =========================
+    # 序列化
+    # =========================
+    def to_bytes(self) -> bytes:
+        out = bytearray(_HEADER.pack(MAGIC, VERSION, self.alpha, self.count, self.sum,
+                                     self.min, self.max, self.zero))
+        for store in (self.pos, self.neg):
+            _put_varint(out, len(store))
+            prev = 0
+            for k in sorted(store):
+                _put_varint(out, _zigzag(k - prev))
+                _put_varint(out, store[k])
+                prev = k
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, blob) -> "DDSketch":
+        blob = bytes(blob)
+        magic, version, alpha, count, total, mn, mx, zero = _HEADER.unpack_from(blob, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a sketch")
+        sk = cls(relative_accuracy=alpha)
+        sk.count, sk.sum, sk.min, sk.max, sk.zero = count, total, mn, mx, zero
+        pos = _HEADER.size
+        for store in (sk.pos, sk.neg):
+            n, pos = _get_varint(blob, pos)
+            prev = 0
+            for _ in range(n):
+                delta, pos = _get_varint(blob, pos)
+                c, pos = _get_varint(blob, pos)
+                prev += _unzigzag(delta)
+                store[prev] = c
+        return sk
+
+
+def _zigzag(n: int) -> int:
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+
+def _unzigzag(n: int) -> int:
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+def _put_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(blob: bytes, pos: int) -> tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = blob[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def merge_blobs(blobs) -> DDSketch | None:
+    """合并多份序列化草图（忽略空值），全部为空时返回 None。"""
+    merged = None
+    for blob in blobs:
+        if not blob:
+            continue
+        sk = DDSketch.from_bytes(blob)
+        merged = sk if merged is None else merged.merge(sk)
+    return merged
+
+
+# =========================
+# 上报路径：进程内缓冲 + 定期合并进 daily_summary
+# =========================
+_lock = threading.Lock()
+_pending: dict[tuple, DDSketch] = {}     # (本地日期, device_id, channel) -> 草图
+_flusher_started = False
+
+
+def record_sample(device_id: int, ts: datetime.datetime, value: float, extra=()):
+    """记录一条上报样本：通道 0 为 value，extra[i] 为通道 i + 1（None 跳过）。只更新内存。"""
+    day = timezone.localdate(ts)
+    with _lock:
+        for channel, v in enumerate((value, *extra)):
+            if v is None:
+                continue
+            key = (day, device_id, channel)
+            sk = _pending.get(key)
+            if sk is None:
+                sk = _pending[key] = DDSketch()
+            sk.add(v)
+    _ensure_flusher()
+
+
+def flush():
+    """
+    把缓冲的草图合并进对应日报行（行不存在时按草图的 count/avg/min/max 新建）。
+    已有行但 sketch 为空（如存储过程写的行）时不动它：只有部分样本的草图会让分位数失真，
+    留空由 reports.fill_missing_sketches 按当天全量数据补算。
+    单个 key 合并失败只记日志并丢弃该 key 的缓冲，不影响其他 key，也不会反复重试同一份坏数据。
+    """
+    global _pending
+    with _lock:
+        batch, _pending = _pending, {}
+    for (day, device_id, channel), sk in batch.items():
+        try:
+            with transaction.atomic():
+                row, created = DailySummary.objects.select_for_update().get_or_create(
+                    day=day, device_id=device_id, channel=channel,
+                    defaults=dict(count_records=sk.count, avg_value=sk.avg, max_value=sk.max,
+                                  min_value=sk.min, sketch=sk.to_bytes()),
+                )
+                if created or not row.sketch:
+                    continue
+                fields = ["sketch"]
+                old = DDSketch.from_bytes(row.sketch)
+                if old.count == row.count_records:
+                    # 行内统计与草图一致（通常是本函数新建的当天行），随草图一起刷新
+                    fields += ["count_records", "avg_value", "max_value", "min_value"]
+                sk = old.merge(sk)
+                row.sketch = sk.to_bytes()
+                row.count_records, row.avg_value, row.max_value, row.min_value = sk.count, sk.avg, sk.max, sk.min
+                row.save(update_fields=fields)
+        except Exception:
+            logger.exception("sketch flush failed for day=%s device=%s channel=%s; dropping %d sample(s)",
+                             day, device_id, channel, sk.count)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.SKETCH_FLUSH_INTERVAL)
+        close_old_connections()
+        try:
+            flush()
+        except Exception:
+            logger.exception("sketch flush failed")
+        finally:
+            connection.close()
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("sketch flush at exit failed")
+
+
+def _ensure_flusher():
+    global _flusher_started
+    if _flusher_started:
+        return
+    with _lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+    atexit.register(_flush_at_exit)      # 后台线程是 daemon，退出时不会等它，最后一个周期的缓冲在这里写入
+    threading.Thread(target=_flush_loop, name="iot-sketch-flush", daemon=True).start()
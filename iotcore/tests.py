@@ -1,3 +1,628 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import math
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import zoneinfo
+from array import array
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import alerting, db_router, jobs, metrics, reports, sketches
+from .channels import pack_channels, unpack_channels
+from .management.commands.backfill import Command as BackfillCommand
+from .models import Alert, AlertState, CloudData, DailySummary, Device, DeviceChannel, EdgeData, Job, SyncQueue
+from .renderers import FastJSONRenderer, SeriesBinaryRenderer
+from .serializers import DailySummarySerializer
+from .series import BINARY_MAGIC, ChunkedSeries, pack_series, render_series, to_epoch_ms, to_local_iso
+from .sketches import DDSketch, merge_blobs
+
+UTC = datetime.timezone.utc
+
+
+# =========================
+# 序列时间格式化
+# =========================
+class ToLocalIsoTests(SimpleTestCase):
+    def _utc(self, *args):
+        return datetime.datetime(*args, tzinfo=UTC)
+
+    def test_fixed_offset(self):
+        ts = [self._utc(2024, 1, 1, 0, 0, 0), self._utc(2024, 1, 1, 16, 30, 5)]
+        with timezone.override(zoneinfo.ZoneInfo("Asia/Shanghai")):
+            self.assertEqual(to_local_iso(ts), ["2024-01-01T08:00:00", "2024-01-02T00:30:05"])
+
+    def test_single_dst_transition(self):
+        # 2024-03-31 01:00Z 起柏林进入夏令时（+01:00 -> +02:00）
+        ts = [self._utc(2024, 3, 31, 0, 30), self._utc(2024, 3, 31, 1, 30)]
+        with timezone.override(zoneinfo.ZoneInfo("Europe/Berlin")):
+            self.assertEqual(to_local_iso(ts), ["2024-03-31T01:30:00", "2024-03-31T03:30:00"])
+
+    def test_range_spanning_both_dst_transitions(self):
+        # 首尾都是冬令时，中间 7 月的点是夏令时
+        ts = [self._utc(2024, 1, 15, 12), self._utc(2024, 7, 15, 12), self._utc(2024, 12, 15, 12)]
+        with timezone.override(zoneinfo.ZoneInfo("Europe/Berlin")):
+            self.assertEqual(
+                to_local_iso(ts),
+                ["2024-01-15T13:00:00", "2024-07-15T14:00:00", "2024-12-15T13:00:00"],
+            )
+
+    def test_descending_order(self):
+        ts = [self._utc(2024, 12, 15, 12), self._utc(2024, 7, 15, 12), self._utc(2024, 1, 15, 12)]
+        with timezone.override(zoneinfo.ZoneInfo("Europe/Berlin")):
+            self.assertEqual(
+                to_local_iso(ts),
+                ["2024-12-15T13:00:00", "2024-07-15T14:00:00", "2024-01-15T13:00:00"],
+            )
+
+    def test_naive_passthrough(self):
+        self.assertEqual(to_local_iso([datetime.datetime(2024, 7, 1, 9, 5)]), ["2024-07-01T09:05:00"])
+        self.assertEqual(to_local_iso([]), [])
+
+
+# =========================
+# 二进制打包 / 分块导出
+# =========================
+def unpack_series(blob: bytes) -> tuple[list, list]:
+    magic, version, _, _, n = struct.unpack_from("<4sBBHQ", blob, 0)
+    assert (magic, version) == (BINARY_MAGIC, 1)
+    ts = array("q", blob[16:16 + 8 * n])
+    values = array("d", blob[16 + 8 * n:16 + 16 * n])
+    assert len(blob) == 16 + 16 * n
+    return list(ts), list(values)
+
+
+class PackSeriesTests(SimpleTestCase):
+    def test_round_trip(self):
+        ts_ms = [0, 1_700_000_000_123, -1, 2 ** 62]
+        values = [0.0, -1.5, 1e300, 26.125]
+        self.assertEqual(unpack_series(pack_series(ts_ms, values)), (ts_ms, values))
+
+    def test_empty(self):
+        self.assertEqual(unpack_series(pack_series([], [])), ([], []))
+
+
+class ChunkedSeriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        base = datetime.datetime(2024, 1, 1, tzinfo=UTC)
+        CloudData.objects.bulk_create([
+            CloudData(device_id=1, sensor_value=i, ts=base + datetime.timedelta(seconds=i // 2),
+                      channel_values=pack_channels([i * 10 if i % 3 else None]))
+            for i in range(25)
+        ])
+        CloudData.objects.create(device_id=2, sensor_value=99, ts=base)
+
+    def _series(self, **kwargs):
+        return ChunkedSeries(CloudData.objects.filter(device_id=1), chunk_size=4, **kwargs)
+
+    def _joined(self, series):
+        ts, values = [], []
+        for t, v in series:
+            ts += t
+            values += v
+        return ts, values
+
+    def test_chunks_cover_all_rows_in_order(self):
+        ts, values = self._joined(self._series())
+        self.assertEqual(values, [float(i) for i in range(25)])
+        self.assertEqual(ts, sorted(ts))
+        self.assertEqual(self._series().count(), 25)
+
+    def test_limit_and_channel(self):
+        self.assertEqual(self._joined(self._series(limit=10))[1], [float(i) for i in range(10)])
+        series = self._series(channel=1)
+        self.assertEqual(self._joined(series)[1], [i * 10.0 for i in range(25) if i % 3])
+        self.assertEqual(series.count(), 16)
+
+    def test_rows_synced_after_start_are_not_exported(self):
+        series = self._series()
+        CloudData.objects.create(device_id=1, sensor_value=-1, ts=datetime.datetime(2030, 1, 1, tzinfo=UTC))
+        self.assertEqual(series.count(), 25)
+        self.assertNotIn(-1.0, self._joined(series)[1])
+
+    def test_truncated(self):
+        self.assertTrue(self._series(limit=10).truncated())
+        self.assertFalse(self._series(limit=25).truncated())
+        self.assertFalse(self._series().truncated())
+
+    def test_binary_stream_aborts_when_rows_change_between_passes(self):
+        chunks = SeriesBinaryRenderer().render_stream(self._series())
+        next(chunks)                        # 头部
+        for _ in range(7):                  # ts 段：25 行 / 每块 4 行
+            next(chunks)
+        CloudData.objects.filter(device_id=1).order_by("ts").first().delete()
+        with self.assertRaises(RuntimeError):
+            list(chunks)
+
+    def test_export_endpoint_streams_and_flags_truncation(self):
+        Device.objects.create(id=1, device_code="E-1", device_name="e")
+        with override_settings(CLOUD_EXPORT_CHUNK_ROWS=4, CLOUD_EXPORT_MAX_ROWS=10):
+            r = self.client.get("/api/cloud/export?device_code=E-1&format=bin")
+            self.assertEqual(r["X-Iot-Export-Truncated"], "true")
+            self.assertEqual(unpack_series(b"".join(r.streaming_content))[1], [float(i) for i in range(10)])
+        r = self.client.get("/api/cloud/export?device_code=E-1")
+        self.assertEqual(r["X-Iot-Export-Truncated"], "false")
+        self.assertEqual(len(json.loads(b"".join(r.streaming_content))["value"]), 25)
+
+    def test_stream_matches_buffered_render(self):
+        ts, values = self._joined(self._series())
+        blob = b"".join(SeriesBinaryRenderer().render_stream(self._series()))
+        self.assertEqual(blob, pack_series(to_epoch_ms(ts), values))
+        for layout in ("rows", "columns"):
+            body = b"".join(FastJSONRenderer().render_stream(self._series(), layout=layout, ts_format="iso"))
+            expected = FastJSONRenderer().render(render_series(ts, values, layout=layout))
+            self.assertEqual(body, expected)
+
+
+# =========================
+# 告警状态机（去抖 / 持续时间 / 回差）
+# =========================
+@override_settings(ALERT_HYSTERESIS=0.5, ALERT_MIN_DURATION=0, ALERT_DEBOUNCE_SAMPLES=3)
+class AlertingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = Device.objects.create(device_code="A-1", device_name="a", threshold_hi=80, threshold_lo=10)
+        cls.base = datetime.datetime(2024, 1, 1, tzinfo=UTC)
+
+    def _sample(self, value, seconds=0, extra=None):
+        edge = EdgeData.objects.create(device=self.device, sensor_value=value, raw_value=value,
+                                       channel_values=pack_channels(extra or []))
+        edge.ts = self.base + datetime.timedelta(seconds=seconds)   # ts 为 auto_now_add，评估用的时刻在内存里指定
+        return alerting.evaluate(self.device, edge)
+
+    def _state(self, level="HIGH", channel=0):
+        return AlertState.objects.get(device=self.device, level=level, channel=channel)
+
+    def test_debounce_then_coalesce(self):
+        self.assertEqual(self._sample(85, 0), [])
+        self.assertEqual(self._sample(86, 1), [])
+        self.assertEqual(self._state().state, "PENDING")
+        [alert] = self._sample(87, 2)
+        self.assertEqual((alert.level, alert.state, alert.count), ("HIGH", "OPEN", 3))
+        self.assertEqual(alert.ts, self.base + datetime.timedelta(seconds=2))   # 取触发样本时间
+        self.assertEqual(self._sample(90, 3), [])
+        alert.refresh_from_db()
+        self.assertEqual((alert.count, alert.last_value), (4, 90))
+        self.assertEqual(Alert.objects.count(), 1)
+
+    def test_hysteresis_band_keeps_alert_open(self):
+        for i in range(3):
+            self._sample(85, i)
+        self._sample(79.8, 3)              # 回差带内（80 - 0.5, 80]
+        self.assertEqual(self._state().state, "OPEN")
+        self._sample(79.4, 4)              # 回差带外
+        self.assertEqual(self._state().state, "CLEARED")
+        alert = Alert.objects.get()
+        self.assertEqual(alert.state, "CLEARED")
+        self.assertEqual(alert.cleared_at, self.base + datetime.timedelta(seconds=4))
+
+    def test_pending_resets_when_value_returns(self):
+        self._sample(85, 0)
+        self._sample(85, 1)
+        self._sample(79.9, 2)              # 去抖中回到带内即放弃本轮
+        self.assertEqual(self._state().state, "CLEARED")
+        self._sample(85, 3)
+        self._sample(85, 4)
+        self.assertEqual(Alert.objects.count(), 0)
+        self.assertEqual(len(self._sample(85, 5)), 1)
+
+    @override_settings(ALERT_DEBOUNCE_SAMPLES=1, ALERT_MIN_DURATION=60)
+    def test_min_duration(self):
+        self.assertEqual(self._sample(5, 0), [])
+        self.assertEqual(self._sample(5, 30), [])
+        [alert] = self._sample(5, 61)
+        self.assertEqual((alert.level, alert.count), ("LOW", 3))
+
+    @override_settings(ALERT_DEBOUNCE_SAMPLES=1)
+    def test_channels_have_independent_state(self):
+        DeviceChannel.objects.create(device=self.device, index=1, name="humidity", threshold_hi=60)
+        [alert] = self._sample(20, 0, extra=[70])
+        self.assertEqual((alert.channel, alert.level), (1, "HIGH"))
+        self.assertIn("humidity", alert.message)
+        self.assertEqual(self._sample(20, 1, extra=[None]), [])     # 缺测不改变状态
+        self.assertEqual(self._state(channel=1).state, "OPEN")
+        self.assertFalse(AlertState.objects.filter(channel=0).exists())
+
+    def test_quiet_sample_costs_one_query(self):
+        edge = EdgeData.objects.create(device=self.device, sensor_value=20, raw_value=20)
+        with self.assertNumQueries(1):
+            self.assertEqual(alerting.evaluate(self.device, edge), [])
+
+
+# =========================
+# 多通道 API
+# =========================
+@override_settings(ALERT_DEBOUNCE_SAMPLES=1, ALERT_MIN_DURATION=0)
+class ChannelApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = Device.objects.create(device_code="MC-1", device_name="mc", sensor_type="temperature",
+                                           threshold_hi=30)
+        DeviceChannel.objects.create(device=cls.device, index=1, name="humidity", threshold_hi=80)
+        DeviceChannel.objects.create(device=cls.device, index=2, name="voltage", threshold_lo=3.0)
+
+    def setUp(self):
+        self.addCleanup(sketches._pending.clear)
+
+    def _upload(self, **body):
+        return self.client.post("/api/data/upload/", {"device_code": "MC-1", **body}, content_type="application/json")
+
+    def test_upload_values(self):
+        self.assertEqual(self._upload(values=[25, 61.5, None]).status_code, 200)
+        edge = EdgeData.objects.get()
+        self.assertEqual(edge.sensor_value, 25)
+        self.assertEqual(list(unpack_channels(edge.channel_values)), [61.5, None])
+        self.assertEqual(self._upload(values=[25, 1, 2, 3]).status_code, 400)   # 未登记的通道
+        self.assertEqual(self._upload(values=[25, "x"]).status_code, 400)
+
+    def test_recent_alerts_value_per_channel(self):
+        self._upload(values=[35, 90, 2.5])
+        data = self.client.get("/api/alerts/recent/", {"device_code": "MC-1"}).json()
+        self.assertEqual({(a["channel"], a["level"]): a["value"] for a in data},
+                         {(0, "HIGH"): 35, (1, "HIGH"): 90, (2, "LOW"): 2.5})
+
+    def test_series_by_channel(self):
+        base = datetime.datetime(2024, 1, 1, tzinfo=UTC)
+        CloudData.objects.bulk_create([
+            CloudData(device_id=self.device.id, sensor_value=20, ts=base, channel_values=pack_channels([60, 3.3])),
+            CloudData(device_id=self.device.id, sensor_value=21, ts=base + datetime.timedelta(minutes=1)),
+            CloudData(device_id=self.device.id, sensor_value=22, ts=base + datetime.timedelta(minutes=2),
+                      channel_values=pack_channels([None, 3.2])),
+        ])
+        get = lambda channel: self.client.get("/api/cloud/series", {
+            "device_code": "MC-1", "layout": "columns", "ts_format": "epoch_ms", "channel": channel,
+        }, HTTP_ACCEPT="application/json")
+        self.assertEqual(get("humidity").json()["value"], [60])
+        self.assertEqual(get("2").json()["value"], [3.3, 3.2])
+        self.assertEqual(get("temperature").json()["value"], [20, 21, 22])
+        self.assertEqual(get("pressure").status_code, 404)
+
+    def test_thresholds_by_channel(self):
+        get = lambda channel: self.client.get("/api/dev/thresholds/", {"device_code": "MC-1", "channel": channel})
+        self.assertEqual(get("voltage").json(), {"threshold_hi": None, "threshold_lo": 3.0})
+        self.assertEqual(get("1").json(), {"threshold_hi": 80, "threshold_lo": None})
+        self.assertEqual(get("0").json()["threshold_hi"], 30)
+        self.assertEqual(get("9").status_code, 404)
+        self.assertEqual(get("²").status_code, 404)      # isdigit 为真但 int() 解析不了
+
+
+# =========================
+# 分位数草图
+# =========================
+def exact_quantile(sorted_values, q):
+    return sorted_values[int(q * (len(sorted_values) - 1))]
+
+
+class DDSketchTests(SimpleTestCase):
+    def _sketch(self, values, **kwargs):
+        sk = DDSketch(**kwargs)
+        for v in values:
+            sk.add(v)
+        return sk
+
+    def assertRelativeError(self, sk, values, alpha=0.01):
+        ordered = sorted(values)
+        for q in (0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 0.999):
+            exact = exact_quantile(ordered, q)
+            self.assertLessEqual(abs(sk.quantile(q) - exact), alpha * abs(exact) + 1e-12, f"q={q}")
+
+    def test_relative_accuracy(self):
+        rnd = random.Random(7)
+        values = [rnd.lognormvariate(3, 1.5) for _ in range(50_000)]
+        self.assertRelativeError(self._sketch(values), values)
+
+    def test_negative_and_zero_values(self):
+        rnd = random.Random(3)
+        values = [rnd.uniform(-50, 50) for _ in range(20_000)] + [0.0] * 500
+        sk = self._sketch(values)
+        self.assertRelativeError(sk, values)
+        self.assertEqual((sk.count, sk.min, sk.max), (len(values), min(values), max(values)))
+        self.assertAlmostEqual(sk.avg, sum(values) / len(values))
+
+    def test_constant_series_stays_within_min_max(self):
+        sk = self._sketch([21.5] * 100)
+        self.assertEqual([sk.quantile(q) for q in (0, 0.5, 0.99, 1)], [21.5] * 4)
+
+    def test_encode_decode(self):
+        rnd = random.Random(11)
+        sk = self._sketch([rnd.gauss(0, 100) for _ in range(5_000)])
+        blob = sk.to_bytes()
+        back = DDSketch.from_bytes(blob)
+        self.assertEqual(back.to_bytes(), blob)
+        self.assertEqual((back.count, back.sum, back.min, back.max, back.zero),
+                         (sk.count, sk.sum, sk.min, sk.max, sk.zero))
+        self.assertEqual(dict(back.pos), dict(sk.pos))
+        self.assertEqual(dict(back.neg), dict(sk.neg))
+        with self.assertRaises(ValueError):
+            DDSketch.from_bytes(b"XXXX" + blob[4:])
+
+    def test_merge_equals_sketch_of_union(self):
+        rnd = random.Random(5)
+        a = [rnd.expovariate(0.1) for _ in range(3_000)]
+        b = [-rnd.expovariate(1) for _ in range(2_000)]
+        merged = self._sketch(a).merge(self._sketch(b))
+        whole = self._sketch(a + b)
+        self.assertEqual(dict(merged.pos), dict(whole.pos))
+        self.assertEqual(dict(merged.neg), dict(whole.neg))
+        self.assertEqual(merged.count, 5_000)
+        self.assertEqual(merge_blobs([self._sketch(a).to_bytes(), None, self._sketch(b).to_bytes()]).to_bytes(),
+                         merged.to_bytes())
+        self.assertIsNone(merge_blobs([None, b""]))
+        with self.assertRaises(ValueError):
+            merged.merge(DDSketch(relative_accuracy=0.02))
+
+    def test_collapse_keeps_upper_quantiles(self):
+        values = [10 ** (i / 1000) for i in range(6_000)]    # 跨 6 个数量级，远超 64 个桶
+        sk = self._sketch(values, max_bins=64)
+        self.assertLessEqual(len(sk.pos), 64)
+        self.assertEqual(sk.count, len(values))
+        ordered = sorted(values)
+        for q in (0.95, 0.99):
+            self.assertAlmostEqual(sk.quantile(q) / exact_quantile(ordered, q), 1, delta=0.01)
+
+    def test_rejects_non_finite(self):
+        sk = DDSketch()
+        for bad in (math.nan, math.inf, -math.inf):
+            with self.assertRaises(ValueError):
+                sk.add(bad)
+        self.assertEqual(sk.count, 0)
+        self.assertIsNone(sk.quantile(0.5))
+
+
+class SketchFlushTests(TestCase):
+    day = datetime.date(2024, 1, 1)
+
+    def setUp(self):
+        sketches._pending.clear()
+
+    def _buffer(self, device_id, values, channel=0, **kwargs):
+        sk = DDSketch(**kwargs)
+        for v in values:
+            sk.add(v)
+        sketches._pending[(self.day, device_id, channel)] = sk
+
+    def test_creates_and_merges_rows(self):
+        self._buffer(1, [1, 2, 3])
+        sketches.flush()
+        self._buffer(1, [4, 5])
+        sketches.flush()
+        row = DailySummary.objects.get(day=self.day, device_id=1, channel=0)
+        self.assertEqual((row.count_records, row.min_value, row.max_value, row.avg_value), (5, 1, 5, 3))
+        self.assertEqual(DDSketch.from_bytes(row.sketch).count, 5)
+
+    def test_row_without_sketch_is_left_for_repair(self):
+        DailySummary.objects.create(day=self.day, device_id=1, count_records=100, avg_value=50)
+        self._buffer(1, [1, 2, 3])
+        sketches.flush()
+        row = DailySummary.objects.get(day=self.day, device_id=1)
+        self.assertIsNone(row.sketch)
+        self.assertEqual(row.count_records, 100)
+
+    def test_failing_key_is_dropped_without_blocking_others(self):
+        DailySummary.objects.create(day=self.day, device_id=1, count_records=1,
+                                    sketch=DDSketch(relative_accuracy=0.02).to_bytes())
+        self._buffer(1, [1.0])          # 精度不同，合并失败
+        self._buffer(2, [2.0])
+        with self.assertLogs("iotcore.sketches", "ERROR"):
+            sketches.flush()
+        self.assertEqual(sketches._pending, {})
+        self.assertEqual(DailySummary.objects.get(device_id=2).count_records, 1)
+        sketches.flush()                # 坏数据不会被反复重试
+        self.assertEqual(DailySummary.objects.get(device_id=1).count_records, 1)
+
+    def test_fill_repairs_missing_and_undercounted_sketches(self):
+        lo, _ = reports.day_bounds(self.day)
+        CloudData.objects.bulk_create(CloudData(device_id=d, sensor_value=v, ts=lo + datetime.timedelta(seconds=v))
+                                      for d in (1, 2, 3) for v in range(1, 11))
+        self._buffer(1, [1, 2, 3])      # 缓冲丢了 7 个样本
+        self._buffer(3, range(1, 11))   # 完整
+        sketches.flush()
+        DailySummary.objects.filter(device_id=1).update(count_records=10)   # 存储过程重写为全量统计
+        DailySummary.objects.create(day=self.day, device_id=2, count_records=10)
+        complete = DailySummary.objects.get(device_id=3).sketch
+
+        self.assertEqual(reports.fill_missing_sketches(self.day), 2)
+        counts = {d: DDSketch.from_bytes(blob).count
+                  for d, blob in DailySummary.objects.values_list("device_id", "sketch")}
+        self.assertEqual(counts, {1: 10, 2: 10, 3: 10})
+        self.assertEqual(DailySummary.objects.get(device_id=3).sketch, complete)
+        self.assertEqual(reports.fill_missing_sketches(self.day), 0)
+
+    def test_flusher_flushes_at_exit(self):
+        with mock.patch.object(sketches, "_flusher_started", False), \
+                mock.patch.object(sketches.atexit, "register") as register, \
+                mock.patch.object(sketches.threading, "Thread"):
+            sketches._ensure_flusher()
+        register.assert_called_once_with(sketches._flush_at_exit)
+        self._buffer(1, [1.0])
+        sketches._flush_at_exit()
+        self.assertEqual(DailySummary.objects.get().count_records, 1)
+
+    def test_serializer_quantiles(self):
+        self._buffer(1, range(1, 101))
+        sketches.flush()
+        data = DailySummarySerializer(DailySummary.objects.all(), many=True).data[0]
+        self.assertNotIn("sketch", data)
+        self.assertAlmostEqual(data["p50"], 50, delta=0.5)
+        self.assertAlmostEqual(data["p99"], 99, delta=1)
+
+
+# =========================
+# 读写分离：副本延迟探测
+# =========================
+class _DeniedConnection:
+    vendor = "mysql"
+
+    def cursor(self):
+        raise Exception("(1227, 'Access denied; you need the REPLICATION CLIENT privilege')")
+
+
+class ReplicaLagProbeTests(SimpleTestCase):
+    def setUp(self):
+        db_router._probe_failed.clear()
+
+    def test_probe_failure_is_logged_once(self):
+        with mock.patch.object(db_router, "connections", {"replica1": _DeniedConnection()}):
+            with self.assertLogs("iotcore.db_router", "WARNING") as logs:
+                self.assertIsNone(db_router._probe_lag("replica1"))
+            self.assertIn("REPLICATION CLIENT", logs.output[0])
+            with self.assertNoLogs("iotcore.db_router", "WARNING"):
+                self.assertIsNone(db_router._probe_lag("replica1"))
+
+
+# =========================
+# 后台任务：遗留任务回收、同步计数
+# =========================
+class _FakeSyncCursor:
+    """
+    包装真实游标，模拟 PROC_sync_to_cloud：按 id 顺序出队 n 条；
+    同时插入一批无关的 cloud_data（并发的 backfill --target cloud）。
+    """
+
+    def __init__(self, cursor, device):
+        self.cursor, self.device = cursor, device
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cursor.close()
+
+    def execute(self, sql, params=None):
+        if not sql.startswith("CALL PROC_sync_to_cloud"):
+            return self.cursor.execute(sql, params)
+        ids = list(SyncQueue.objects.order_by("id").values_list("id", flat=True)[:params[0]])
+        SyncQueue.objects.filter(id__in=ids).delete()
+        CloudData.objects.bulk_create(
+            CloudData(device_id=self.device.id, sensor_value=0, ts=timezone.now()) for _ in range(7))
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        self.device = Device.objects.create(device_code="J-1", device_name="j")
+
+    def _job(self, status, **times):
+        job = Job.objects.create(kind="sync", status=status)
+        Job.objects.filter(pk=job.pk).update(**times)
+        return job
+
+    @override_settings(IOT_JOB_STALE_AFTER=600)
+    def test_reap_orphans(self):
+        old = timezone.now() - datetime.timedelta(hours=1)
+        lost = self._job("running", started_at=old, heartbeat_at=old)
+        legacy = self._job("running", started_at=old)
+        never_started = self._job("queued", created_at=old)
+        alive = self._job("running", started_at=old, heartbeat_at=timezone.now())
+        waiting = self._job("queued")
+        backfill = Job.objects.create(kind="backfill", status="running", started_at=old)
+
+        with self.assertLogs("iotcore.jobs", "WARNING"):
+            self.assertEqual(jobs.reap_orphans(), 3)
+        status = dict(Job.objects.values_list("id", "status"))
+        for job in (lost, legacy, never_started):
+            self.assertEqual(status[job.id], "failed")
+        for job in (alive, backfill):
+            self.assertEqual(status[job.id], "running")
+        self.assertEqual(status[waiting.id], "queued")
+        self.assertTrue(Job.objects.get(pk=lost.pk).error.startswith("orphaned"))
+
+    @override_settings(IOT_SYNC_BATCH=4)
+    def test_sync_counts_drained_queue_rows_only(self):
+        for i in range(10):
+            SyncQueue.objects.create(edge_data=EdgeData.objects.create(device=self.device, sensor_value=i))
+        job = Job.objects.create(kind="sync")
+        cursor = jobs.connection.cursor
+        with mock.patch.object(jobs.connection, "cursor", lambda: _FakeSyncCursor(cursor(), self.device)):
+            jobs.run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "succeeded")
+        self.assertEqual(job.rows_processed, 10)
+        self.assertIsNotNone(job.heartbeat_at)
+        self.assertFalse(SyncQueue.objects.exists())
+
+
+# =========================
+# 指标：多进程快照
+# =========================
+class MetricsSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        settings = override_settings(METRICS_DIR=self.dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def _write(self, name, value):
+        snap = {"counters": [["iot_test_total", [], value]], "histograms": []}
+        (Path(self.dir.name) / name).write_text(json.dumps(snap))
+
+    def test_inc_starts_flusher(self):
+        with mock.patch.object(metrics, "_ensure_flusher") as ensure:
+            metrics.inc("iot_sync_rows_total", 0)
+        ensure.assert_called_once()
+
+    def test_dead_worker_snapshots_are_folded(self):
+        proc = subprocess.Popen([sys.executable, "-c", "pass"])
+        proc.wait()
+        self._write(f"{proc.pid}.json", 5)
+        self._write(metrics.DEAD_FILE, 2)
+        for _ in range(2):
+            counters, _ = metrics._collect()
+            self.assertEqual(counters[("iot_test_total", ())], 7)
+        self.assertEqual(sorted(p.name for p in Path(self.dir.name).glob("*.json")), [metrics.DEAD_FILE])
+
+
+# =========================
+# 日报重算 / 回灌
+# =========================
+class RebuildSummaryTests(TestCase):
+    day = datetime.date(2024, 3, 1)
+
+    def setUp(self):
+        self.device = Device.objects.create(device_code="R-1", device_name="r")
+
+    def _add(self, *values):
+        lo, _ = reports.day_bounds(self.day)
+        CloudData.objects.bulk_create(
+            CloudData(device_id=self.device.id, sensor_value=v, ts=lo + datetime.timedelta(minutes=i))
+            for i, v in enumerate(values))
+
+    def test_rebuild_upserts(self):
+        self._add(1, 2, 3)
+        reports.rebuild_daily_summary(self.day, self.day)
+        self._add(4)
+        reports.rebuild_daily_summary(self.day, self.day)
+        row = DailySummary.objects.get()
+        self.assertEqual((row.count_records, row.max_value), (4, 4))
+
+    def test_upsert_without_conflict_target(self):
+        """MySQL（不支持指定冲突列）不能传 unique_fields。"""
+        self._add(1)
+        for supported in (True, False):
+            with mock.patch.object(connection.features, "supports_update_conflicts_with_target", supported), \
+                    mock.patch.object(DailySummary.objects, "bulk_create") as bulk_create:
+                reports.rebuild_daily_summary(self.day, self.day)
+            kwargs = bulk_create.call_args.kwargs
+            self.assertTrue(kwargs["update_conflicts"])
+            self.assertEqual(kwargs.get("unique_fields"), reports.UNIQUE_FIELDS if supported else None)
+
+    def test_backfill_aborts_when_sync_is_skipped(self):
+        SyncQueue.objects.create(edge_data=EdgeData.objects.create(device=self.device, sensor_value=1))
+        skipped = Job.objects.create(kind="sync", status="skipped", error="another job holding iot_job:sync")
+        with mock.patch.object(jobs, "run_job", return_value=skipped) as run_job, \
+                self.assertRaisesMessage(CommandError, "skipped"):
+            BackfillCommand(stdout=io.StringIO())._drain_sync_queue()
+        run_job.assert_called_once()
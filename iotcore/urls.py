@@ -1,12 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DeviceViewSet, AlertViewSet, ReportViewSet, upload_data,  run_sync, run_daily_report
-from .views import cloud_series, daily_series,charts_page
+from .views import DeviceViewSet, AlertViewSet, ReportViewSet, JobViewSet, upload_data,  run_sync, run_daily_report
+from .views import cloud_series, cloud_export, daily_series, report_percentiles, charts_page
 
 router = DefaultRouter()
 router.register(r'devices', DeviceViewSet)
 router.register(r'alerts',  AlertViewSet)
 router.register(r'report/daily', ReportViewSet)
+router.register(r'jobs', JobViewSet)
 
 urlpatterns = [
     path('api/', include(router.urls)),
@@ -14,7 +15,9 @@ urlpatterns = [
     path('api/sync/run/', run_sync),
     path('api/report/run/', run_daily_report),
     path('api/cloud/series', cloud_series),
+    path('api/cloud/export', cloud_export),
     path('api/report/daily/series', daily_series),
+    path('api/report/percentiles', report_percentiles),
     path('charts/', charts_page),
 ]
 
@@ -2,21 +2,33 @@
 from __future__ import annotations
 
 import datetime
+import logging
+import math
 from typing import Optional
 
-from django.db import connection
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.utils.dateparse import parse_datetime, parse_date
 from rest_framework import viewsets
-from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, renderer_classes
 from rest_framework.permissions import AllowAny
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from django.views.decorators.csrf import csrf_exempt
 
-from .models import Device, EdgeData, Alert, DailySummary, CloudData
-from .serializers import DeviceSerializer, AlertSerializer, DailySummarySerializer
+from .db_router import ReplicaReadMixin, replica_read
+from . import alerting, jobs, metrics, sketches
+from .channels import pack_channels, sample_value
+from .models import Device, EdgeData, Alert, DailySummary, CloudData, Job
+from .renderers import BINARY_FORMATS, SERIES_RENDERERS, FastJSONRenderer
+from .series import LAYOUTS, TS_FORMATS, ChunkedSeries, fetch_columns, render_series
+from .serializers import DeviceSerializer, AlertSerializer, DailySummarySerializer, JobSerializer
 from django.utils import timezone
 import datetime as _dt
+
+logger = logging.getLogger(__name__)
+
 # =========================
 # Helpers
 # =========================
@@ -35,9 +47,12 @@ def _parse_dt(s: Optional[str], *, end: bool = False) -> Optional[datetime.datet
     if s.endswith("Z"):
         s = s[:-1] + "+00:00"  # 让 parse_datetime 识别 UTC
 
-    dt = parse_datetime(s)
-    if dt is None:  # 仅日期
-        d = parse_date(s)
+    try:
+        dt = parse_datetime(s)
+        d = parse_date(s) if dt is None else None   # 仅日期
+    except ValueError:  # 格式对但日期/时间不存在，如 2024-02-30
+        return None
+    if dt is None:
         if d is None:
             return None
         t = datetime.time(23, 59, 59) if end else datetime.time(0, 0, 0)
@@ -52,15 +67,6 @@ def _parse_dt(s: Optional[str], *, end: bool = False) -> Optional[datetime.datet
     return dt
 
 
-def _to_local_iso(dt: datetime.datetime) -> str:
-    """
-    把数据库时间转成本地时区，并输出“无时区”的 ISO 字符串（YYYY-MM-DDTHH:MM:SS），
-    避免前端再偏移 8 小时。
-    """
-    if timezone.is_naive(dt):
-        dt = timezone.make_aware(dt, timezone.get_current_timezone())
-    dt = timezone.localtime(dt, timezone.get_current_timezone())
-    return dt.strftime("%Y-%m-%dT%H:%M:%S")
 from django.conf import settings
 from django.utils import timezone
 
@@ -82,21 +88,26 @@ def _to_local_str(dt):
 # =========================
 # DRF ViewSets（如需）
 # =========================
-class DeviceViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Device.objects.all().order_by("-created_at")
+class DeviceViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Device.objects.prefetch_related("channels").order_by("-created_at")
     serializer_class = DeviceSerializer
 
 
-class AlertViewSet(viewsets.ReadOnlyModelViewSet):
+class AlertViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Alert.objects.all().order_by("-ts")
     serializer_class = AlertSerializer
 
 
-class ReportViewSet(viewsets.ReadOnlyModelViewSet):
+class ReportViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = DailySummary.objects.all().order_by("-day")
     serializer_class = DailySummarySerializer
 
 
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Job.objects.all().order_by("-id")
+    serializer_class = JobSerializer
+
+
 # =========================
 # Pages
 # =========================
@@ -114,105 +125,236 @@ def charts_page(request):
 def upload_data(request):
     """
     设备/脚本上报：{ "device_code":"T-001", "sensor_value": 26.5 }
+    多通道设备一次上报全部通道：{ "device_code":"T-001", "values": [26.5, 61.2, 3.3] }
+    values[0] 为主量（即 sensor_value），values[i] 对应 DeviceChannel.index == i，缺测传 null。
+    可选 source_ts（设备自带时间，格式同 from/to，带 Z 按 UTC）。
     注意：显式写 quality=1，避免历史模型默认 'GOOD' 导致 MySQL 报错。
     """
     try:
         device_code = request.data.get("device_code")
         val = request.data.get("sensor_value")
+        extra = []
 
         if not device_code:
             return Response({"detail": "device_code required"}, status=400)
+        vector = request.data.get("values")
+        if vector is not None:
+            if not isinstance(vector, list) or not vector:
+                return Response({"detail": "values must be a non-empty list"}, status=400)
+            try:
+                vector = [None if v is None else float(v) for v in vector]
+            except (TypeError, ValueError):
+                return Response({"detail": "values must be numbers or null"}, status=400)
+            if any(v is not None and not math.isfinite(v) for v in vector):
+                return Response({"detail": "values must be finite"}, status=400)
+            if val is None:
+                val = vector[0]
+            extra = vector[1:]
         try:
             value = float(val)
         except (TypeError, ValueError):
             return Response({"detail": "sensor_value must be number"}, status=400)
+        if not math.isfinite(value):   # "nan" / "inf" 能被 float 解析，但存不进数值列，也会污染日报草图
+            return Response({"detail": "sensor_value must be finite"}, status=400)
+        src = request.data.get("source_ts")
+        source_ts = _parse_dt(str(src)) if src else None
+        if src and source_ts is None:
+            return Response({"detail": "invalid source_ts"}, status=400)
 
         device = Device.objects.filter(device_code=device_code).first()
         if not device:
             return Response({"detail": f"device '{device_code}' not found"}, status=404)
-
-        EdgeData.objects.create(
-            device=device,
-            sensor_value=value,
-            raw_value=value,
-            quality=1,   # 关键
-        )
+        channels = None
+        if extra:
+            channels = list(device.channels.all())
+            if len(extra) > max((c.index for c in channels), default=0):
+                return Response({"detail": f"values has {len(extra)} extra channel(s), "
+                                           f"device has {len(channels)} registered"}, status=400)
+
+        with transaction.atomic():
+            edge = EdgeData.objects.create(
+                device=device,
+                sensor_value=value,
+                raw_value=value,
+                source_ts=source_ts,
+                quality=1,   # 关键
+                channel_values=pack_channels(extra),
+            )
+            alerting.evaluate(device, edge, channels)
+        sketches.record_sample(device.id, edge.ts, value, extra)
+        metrics.inc("iot_ingest_samples_total", protocol=device.protocol or "unknown")
         return Response({"ok": True}, status=200)
     except Exception as e:
-        import traceback
-        print("upload_data error:", e); traceback.print_exc()
+        logger.exception("upload_data error")
+        metrics.inc("iot_ingest_errors_total")
         return Response({"detail": f"server error: {e}"}, status=500)
 
 
 @api_view(["POST"])
 def run_sync(request):
-    """手动执行：队列 → cloud_data"""
-    with connection.cursor() as cur:
-        cur.execute("CALL PROC_sync_to_cloud(%s)", [500])
-    return Response({"synced": "ok"})
+    """手动执行：队列 → cloud_data。后台执行，立即返回 job_id，进度见 /api/jobs/<id>/"""
+    job = jobs.submit("sync")
+    return Response({"job_id": job.id, "status": job.status}, status=202)
 
 
 @api_view(["POST"])
 def run_daily_report(request):
-    """手动生成日报。body 可传 { "day": "YYYY-MM-DD" }，不传则用今天。"""
+    """手动生成日报。body 可传 { "day": "YYYY-MM-DD" }，不传则用今天。后台执行，立即返回 job_id。"""
     day = request.data.get("day")
-    with connection.cursor() as cur:
-        cur.execute("CALL PROC_generate_report(COALESCE(%s, CURDATE()))", [day])
-    return Response({"report": "ok"})
+    if day:
+        try:
+            d = parse_date(str(day))
+        except ValueError:    # 格式对但日期不存在，如 2024-13-45
+            d = None
+        if d is None:
+            return Response({"detail": "invalid day"}, status=400)
+    else:
+        d = timezone.localdate()
+    # 日期总是写进参数：任务按 kind + 日期加锁，不同日期的请求可以并行
+    job = jobs.submit("daily_report", {"day": d.isoformat()})
+    return Response({"job_id": job.id, "status": job.status}, status=202)
 
 
-@api_view(["GET"])
-def cloud_series(request):
+def _series_output(request, default_layout: str = "rows"):
     """
-    GET /api/cloud/series?device_code=T-001&limit=500
-    可选 from/to（本地或带Z的UTC）。若未提供 from/to，则返回“最新的 limit 条”，并按时间升序输出。
+    解析 layout / ts_format；二进制格式（?format=bin|arrow 或对应 Accept）固定为列式 + 毫秒时间戳。
+    返回 (layout, ts_format, 错误响应或 None)。
     """
-    device_code = request.GET.get("device_code")
-    if not device_code:
-        return Response({"detail": "device_code required"}, status=400)
-    device = get_object_or_404(Device, device_code=device_code)
-
+    if request.accepted_renderer.format in BINARY_FORMATS:
+        return "columns", "epoch_ms", None
+    layout = request.GET.get("layout", default_layout)
+    if layout not in LAYOUTS:
+        return None, None, Response({"detail": "invalid layout"}, status=400)
+    ts_format = request.GET.get("ts_format", "iso")
+    if ts_format not in TS_FORMATS:
+        return None, None, Response({"detail": "invalid ts_format"}, status=400)
+    return layout, ts_format, None
+
+
+def _channel_param(request, device):
+    """解析 ?channel=（通道号或通道名，缺省 0 即主量）。返回 (通道号, 错误响应或 None)。"""
+    raw = request.GET.get("channel")
+    if raw in (None, "", "0") or raw == device.sensor_type:
+        return 0, None
+    channels = device.channels.all()
+    # isdecimal 而不是 isdigit：上标 "²" 之类 isdigit 为真但 int() 解析不了
+    ch = channels.filter(index=int(raw)).first() if raw.isdecimal() else channels.filter(name=raw).first()
+    if ch is None:
+        return None, Response({"detail": f"unknown channel '{raw}'"}, status=404)
+    return ch.index, None
+
+
+def _cloud_queryset(request, device):
+    """按 from/to 过滤 cloud_data。返回 (queryset, 是否带时间范围, 错误响应或 None)。"""
     from_str = request.GET.get("from")
     to_str   = request.GET.get("to")
-    limit    = int(request.GET.get("limit", 500))
-    limit    = max(1, min(limit, 5000))
 
     dt_from = _parse_dt(from_str, end=False) if from_str else None
     if from_str and dt_from is None:
-        return Response({"detail": "invalid from"}, status=400)
+        return None, False, Response({"detail": "invalid from"}, status=400)
 
     dt_to = _parse_dt(to_str, end=True) if to_str else None
     if to_str and dt_to is None:
-        return Response({"detail": "invalid to"}, status=400)
+        return None, False, Response({"detail": "invalid to"}, status=400)
 
     qs = CloudData.objects.filter(device_id=device.id)
     if dt_from:
         qs = qs.filter(ts__gte=dt_from)
     if dt_to:
         qs = qs.filter(ts__lte=dt_to)
+    return qs, bool(dt_from or dt_to), None
+
 
-    if dt_from or dt_to:
+@replica_read
+@api_view(["GET"])
+@renderer_classes([*SERIES_RENDERERS, BrowsableAPIRenderer])
+def cloud_series(request):
+    """
+    GET /api/cloud/series?device_code=T-001&limit=500
+    可选 from/to（本地或带Z的UTC）。若未提供 from/to，则返回“最新的 limit 条”，并按时间升序输出。
+    可选 layout=rows|columns（默认 rows：[{ts, value}]；columns：{"ts":[...], "value":[...]}），
+    ts_format=iso|epoch_ms（默认 iso：本地无时区字符串；epoch_ms：UTC 毫秒时间戳）。
+    可选 channel=通道号或名称（默认 0 主量），多通道设备按通道取序列，缺测的点不返回。
+    Accept: application/octet-stream（或 ?format=bin）返回打包的二进制数组，见 series.pack_series；
+    安装 pyarrow 后支持 application/vnd.apache.arrow.stream（?format=arrow）。
+    """
+    device_code = request.GET.get("device_code")
+    if not device_code:
+        return Response({"detail": "device_code required"}, status=400)
+    layout, ts_format, err = _series_output(request)
+    if err:
+        return err
+    device = get_object_or_404(Device, device_code=device_code)
+
+    limit    = int(request.GET.get("limit", 500))
+    limit    = max(1, min(limit, 5000))
+
+    channel, err = _channel_param(request, device)
+    if err:
+        return err
+    qs, ranged, err = _cloud_queryset(request, device)
+    if err:
+        return err
+    if channel:
+        qs = qs.filter(channel_values__isnull=False)
+
+    if ranged:
         # 有时间范围：按时间升序取（范围内前 limit 条）
-        rows = list(qs.order_by("ts")[:limit])
+        ts, values = fetch_columns(qs.order_by("ts")[:limit], channel=channel)
     else:
         # 无时间范围：默认取“最新的 limit 条”，再反转成升序返回
-        rows = list(qs.order_by("-ts")[:limit])[::-1]
+        ts, values = fetch_columns(qs.order_by("-ts")[:limit], channel=channel)
+        ts.reverse()
+        values.reverse()
 
-    data = [{"ts": _to_local_iso(c.ts), "value": float(c.sensor_value)} for c in rows]
+    data = render_series(ts, values, layout=layout, ts_format=ts_format)
     return Response(data, status=200)
 
 
+@replica_read
 @api_view(["GET"])
-def daily_series(request):
+@renderer_classes(SERIES_RENDERERS)
+def cloud_export(request):
     """
-    GET /api/report/daily/series?device_code=T-001&days=7
-    可选 from/to（同 cloud_series），优先级高于 days。
+    GET /api/cloud/export?device_code=T-001&from=...&to=...
+    导出时间范围内的全部点（上限 settings.CLOUD_EXPORT_MAX_ROWS），默认列式输出（layout/ts_format/channel 同 cloud_series）。
+    内容协商同 cloud_series：JSON（默认）/ application/octet-stream / Arrow IPC；二进制格式以附件下载。
+    按 CLOUD_EXPORT_CHUNK_ROWS 分块读取、边读边发（见 series.ChunkedSeries），不在内存里攒整段结果。
+    范围内超过上限时只导出前 CLOUD_EXPORT_MAX_ROWS 行，响应头 X-Iot-Export-Truncated: true。
     """
     device_code = request.GET.get("device_code")
     if not device_code:
         return Response({"detail": "device_code required"}, status=400)
+    layout, ts_format, err = _series_output(request, default_layout="columns")
+    if err:
+        return err
     device = get_object_or_404(Device, device_code=device_code)
 
+    channel, err = _channel_param(request, device)
+    if err:
+        return err
+    qs, _, err = _cloud_queryset(request, device)
+    if err:
+        return err
+    if channel:
+        qs = qs.filter(channel_values__isnull=False)
+
+    series = ChunkedSeries(qs, channel=channel, limit=settings.CLOUD_EXPORT_MAX_ROWS,
+                           chunk_size=settings.CLOUD_EXPORT_CHUNK_ROWS)
+    renderer = request.accepted_renderer
+    chunks = renderer.render_stream(series, layout=layout, ts_format=ts_format)
+    response = StreamingHttpResponse(series.stream(chunks), content_type=renderer.media_type)
+    # 超过上限的部分不导出：用响应头告诉客户端结果被截断，需缩小时间范围分段导出
+    response["X-Iot-Export-Truncated"] = "true" if series.truncated() else "false"
+    response["X-Iot-Export-Limit"] = str(settings.CLOUD_EXPORT_MAX_ROWS)
+    if renderer.format in BINARY_FORMATS:
+        suffix = f"-ch{channel}" if channel else ""
+        response["Content-Disposition"] = f'attachment; filename="{device.device_code}{suffix}.{renderer.format}"'
+    return response
+
+
+def _day_range(request):
+    """from/to（同 cloud_series）优先，否则 to（缺省今天）往前 days 天（1~90，默认 7）。返回 (起, 止, 错误响应或 None)。"""
     to_str = request.GET.get("to")
     from_str = request.GET.get("from")
     days = int(request.GET.get("days", 7))
@@ -221,7 +363,7 @@ def daily_series(request):
     if to_str:
         dt_to = _parse_dt(to_str, end=True)
         if dt_to is None:
-            return Response({"detail": "invalid to"}, status=400)
+            return None, None, Response({"detail": "invalid to"}, status=400)
         end_day = dt_to.date()
     else:
         end_day = timezone.now().date()
@@ -229,34 +371,150 @@ def daily_series(request):
     if from_str:
         dt_from = _parse_dt(from_str, end=False)
         if dt_from is None:
-            return Response({"detail": "invalid from"}, status=400)
+            return None, None, Response({"detail": "invalid from"}, status=400)
         start_day = dt_from.date()
     else:
         start_day = end_day - timezone.timedelta(days=max(1, min(days, 90)) - 1)
+    return start_day, end_day, None
+
+
+def _quantiles(request):
+    """q=0.5,0.95,0.99 -> [(0.5, "p50"), ...]。返回 (列表, 错误响应或 None)。"""
+    try:
+        qs = [float(x) for x in request.GET.get("q", "0.5,0.95,0.99").split(",") if x]
+    except ValueError:
+        return None, Response({"detail": "invalid q"}, status=400)
+    if not qs or any(not 0 <= q <= 1 for q in qs):
+        return None, Response({"detail": "q must be within [0, 1]"}, status=400)
+    return [(q, f"p{q * 100:g}") for q in qs], None
+
+
+@replica_read
+@api_view(["GET"])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+def daily_series(request):
+    """
+    GET /api/report/daily/series?device_code=T-001&days=7
+    可选 from/to（同 cloud_series），优先级高于 days；可选 channel（同 cloud_series）。
+    每天附带 p50/p95/p99（由当天的分位数草图计算；没有草图的日期为 null），可用 q=0.5,0.9 自定义。
+    """
+    device_code = request.GET.get("device_code")
+    if not device_code:
+        return Response({"detail": "device_code required"}, status=400)
+    device = get_object_or_404(Device, device_code=device_code)
+    channel, err = _channel_param(request, device)
+    if err:
+        return err
+    start_day, end_day, err = _day_range(request)
+    if err:
+        return err
+    quantiles, err = _quantiles(request)
+    if err:
+        return err
 
     qs = DailySummary.objects.filter(
-        device_id=device.id, day__gte=start_day, day__lte=end_day
+        device_id=device.id, channel=channel, day__gte=start_day, day__lte=end_day
     ).order_by("day")
 
-    data = [
-        {
+    data = []
+    for r in qs:
+        sk = sketches.DDSketch.from_bytes(r.sketch) if r.sketch else None
+        item = {
             "day": r.day.strftime("%Y-%m-%d"),
             "avg_value": float(r.avg_value) if r.avg_value is not None else None,
             "max_value": float(r.max_value) if r.max_value is not None else None,
             "min_value": float(r.min_value) if r.min_value is not None else None,
             "alert_count": int(r.alert_count or 0),
         }
-        for r in qs
-    ]
+        for q, key in quantiles:
+            item[key] = sk.quantile(q) if sk else None
+        data.append(item)
+    return Response(data, status=200)
+
+
+@replica_read
+@api_view(["GET"])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+def report_percentiles(request):
+    """
+    GET /api/report/percentiles?location=site-1&from=2025-01-01&to=2025-01-31&group_by=device
+    合并 daily_summary 中的分位数草图，得到任意日期范围 / 设备集合的分位数，不扫描原始数据。
+    设备集合：device_code（逗号分隔）/ location / sensor_type，都不传为全部设备；channel 为通道号（默认 0）。
+    日期同 daily_series（from/to 或 days）；q 同 daily_series；group_by=none|device|location|day（默认 none）。
+    -> [{group, devices, days, count, avg, min, max, p50, p95, p99, missing}, ...]
+    missing 为该组中没有草图的日报行数（其数据未计入分位数）。
+    """
+    group_by = request.GET.get("group_by", "none")
+    if group_by not in ("none", "device", "location", "day"):
+        return Response({"detail": "invalid group_by"}, status=400)
+    channel = request.GET.get("channel", "0")
+    if not channel.isdecimal():
+        return Response({"detail": "channel must be a channel index"}, status=400)
+    start_day, end_day, err = _day_range(request)
+    if err:
+        return err
+    quantiles, err = _quantiles(request)
+    if err:
+        return err
+
+    devices = Device.objects.all()
+    if request.GET.get("device_code"):
+        devices = devices.filter(device_code__in=request.GET["device_code"].split(","))
+    if request.GET.get("location"):
+        devices = devices.filter(location=request.GET["location"])
+    if request.GET.get("sensor_type"):
+        devices = devices.filter(sensor_type=request.GET["sensor_type"])
+    info = {i: (code, loc) for i, code, loc in devices.values_list("id", "device_code", "location")}
+    if not info:
+        return Response({"detail": "no matching devices"}, status=404)
+
+    key_of = {
+        "none": lambda device_id, day: "all",
+        "device": lambda device_id, day: info[device_id][0],
+        "location": lambda device_id, day: info[device_id][1],
+        "day": lambda device_id, day: day.isoformat(),
+    }[group_by]
+    groups = {}
+    rows = DailySummary.objects.filter(
+        device_id__in=info, channel=int(channel), day__gte=start_day, day__lte=end_day
+    ).values_list("device_id", "day", "sketch")
+    for device_id, day, blob in rows.iterator(chunk_size=1000):
+        g = groups.setdefault(key_of(device_id, day), {"sketch": None, "devices": set(), "days": set(), "missing": 0})
+        g["devices"].add(device_id)
+        g["days"].add(day)
+        if not blob:
+            g["missing"] += 1
+            continue
+        sk = sketches.DDSketch.from_bytes(blob)
+        g["sketch"] = sk if g["sketch"] is None else g["sketch"].merge(sk)
+
+    data = []
+    for key in sorted(groups):
+        g = groups[key]
+        sk = g["sketch"]
+        item = {
+            "group": key, "devices": len(g["devices"]), "days": len(g["days"]),
+            "count": sk.count if sk else 0, "avg": sk.avg if sk else None,
+            "min": sk.min if sk else None, "max": sk.max if sk else None,
+        }
+        for q, name in quantiles:
+            item[name] = sk.quantile(q) if sk else None
+        item["missing"] = g["missing"]
+        data.append(item)
     return Response(data, status=200)
 
 
 # ========== 前端新增用：实时阈值 & 最近告警 ==========
 @api_view(['GET'])
 def device_thresholds(request):
-    """GET /api/dev/thresholds/?device_code=T-001 -> {threshold_hi, threshold_lo}"""
+    """GET /api/dev/thresholds/?device_code=T-001[&channel=humidity] -> {threshold_hi, threshold_lo}"""
     code = request.GET.get("device_code")
     dev = get_object_or_404(Device, device_code=code)
+    channel, err = _channel_param(request, dev)
+    if err:
+        return err
+    if channel:
+        dev = dev.channels.get(index=channel)
     return Response({"threshold_hi": dev.threshold_hi, "threshold_lo": dev.threshold_lo})
 
 
@@ -264,7 +522,8 @@ def device_thresholds(request):
 def recent_alerts(request):
     """
     GET /api/alerts/recent/?device_code=T-001&limit=20
-    -> [{id, level, value, ts, message, edge_data_id}, ...]
+    -> [{id, level, channel, value, ts, message, edge_data_id, state, count, last_value, last_ts}, ...]
+    每条为一次告警事件：value 为触发时该通道的样本值，count / last_value 为事件内累计越限样本数与最新值。
     """
     code  = request.GET.get("device_code")
     limit = int(request.GET.get("limit", 20))
@@ -272,14 +531,23 @@ def recent_alerts(request):
 
     alerts = list(Alert.objects.filter(device_id=dev.id).order_by('-id')[:max(1, min(limit, 200))])
     ed_ids = [a.edge_data_id for a in alerts]
-    values = {e.id: e.sensor_value for e in EdgeData.objects.filter(id__in=ed_ids)}
+    samples = {i: (v, blob) for i, v, blob in
+               EdgeData.objects.filter(id__in=ed_ids).values_list("id", "sensor_value", "channel_values")}
+    # 同一样本可能在多个通道上各开一条告警，按 (样本, 通道) 取值
+    values = {(a.edge_data_id, a.channel): sample_value(*samples[a.edge_data_id], a.channel)
+              for a in alerts if a.edge_data_id in samples}
 
     data = [{
         "id": a.id,
         "level": a.level,                         # HIGH / LOW
-        "value": values.get(a.edge_data_id),      # 温度值
+        "channel": a.channel,                     # 0=主量
+        "value": values.get((a.edge_data_id, a.channel)),   # 触发样本在该通道的值
         "ts":_to_local_str(a.ts),
         "message": a.message,
         "edge_data_id": a.edge_data_id,
+        "state": a.state,                         # OPEN / CLEARED
+        "count": a.count,
+        "last_value": a.last_value,
+        "last_ts": _to_local_str(a.last_ts),
     } for a in alerts]
     return Response(data)
\ No newline at end of file